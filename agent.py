@@ -0,0 +1,245 @@
+import json
+from google.genai import types
+
+# Import all function schemas
+from functions.get_files_info import schema_get_files_info
+from functions.get_file_content import schema_get_file_content
+from functions.run_python import schema_run_python_file
+from functions.write_file import schema_write_file
+
+# Import the call_function from our executor module
+from functions.tool_code_executor import call_function
+from functions.workspace import get_workspace
+
+from loop_guard import LoopGuard, CYCLE_HINT
+from config import WORKING_DIRECTORY, MODEL_NAME, MAX_ITERATIONS, MAX_OUTPUT_TOKENS
+
+
+# --- STRICT SYSTEM PROMPT ---
+SYSTEM_PROMPT = """
+You are a helpful AI coding agent. Your ONLY goal is to debug and FIX Python code in the existing codebase, specifically in the working directory.
+
+When a user reports a bug:
+1. **Understand the problem**: Analyze the user's bug description and expected vs. actual output.
+2. **Inspect files**: Use `get_files_info` to list files and `get_file_content` to read relevant code files (e.g., `calculator/pkg/calculator.py`).
+3. **Identify the bug**: Pinpoint the exact location and cause of the error in the code.
+4. **Apply the fix**: Use ONLY `write_file` to update the problematic file (e.g., `calculator/pkg/calculator.py`) with the corrected code. DO NOT create new files unless explicitly requested.
+5. **Verify the fix**: Use `run_python_file` to execute the affected script (e.g., `calculator/main.py`) with the original problematic input to confirm the bug is resolved and the output matches the expected result.
+6. **Final Answer**: Once the bug is confirmed to be fixed, provide a clear, concise explanation of what the bug was, how you fixed it, and the verification result.
+
+You MUST update the actual code file containing the bug. Do NOT write a new file or script unless the user asks for it. All paths should be relative to the working directory (`./calculator`). The working directory is automatically injected for security reasons.
+"""
+# --- END STRICT SYSTEM PROMPT ---
+
+# Built once at import time: this prefix is identical on every turn, so it is
+# also what gets stored in the context cache.
+AVAILABLE_FUNCTIONS = types.Tool(
+    function_declarations=[
+        schema_get_files_info,
+        schema_get_file_content,
+        schema_run_python_file,
+        schema_write_file,
+    ]
+)
+
+
+def run_agent(client, prompt_cache, user_prompt, working_directory=WORKING_DIRECTORY,
+              model_name=MODEL_NAME, max_iterations=MAX_ITERATIONS, verbose=False,
+              generation_config=None, session_log=None, messages=None, start_turn=0,
+              router=None, context_pack=None):
+    """
+    Runs one agent session: alternates model turns and tool calls until the
+    model claims a verified fix, stops calling tools, keeps cycling after a
+    corrective hint, or the iteration limit is reached.
+
+    Args:
+        client: The model client (only `client.models` is used).
+        prompt_cache (ContextCache): Supplies the cached system prompt and tools.
+        user_prompt (str): The user's bug report.
+        working_directory (str, optional): The workspace every tool call is
+                                           confined to.
+        model_name (str, optional): The model to call when no router is given.
+        max_iterations (int, optional): Maximum number of model turns.
+        verbose (bool, optional): If True, prints each turn in detail.
+        generation_config (dict, optional): Extra GenerateContentConfig fields
+                                            (e.g. temperature).
+        session_log (SessionLog, optional): If given, every turn and the
+                                            session's end are appended to it.
+        messages (list[types.Content], optional): A conversation to continue
+                                                  (e.g. rebuilt from a session
+                                                  log) instead of starting from
+                                                  `user_prompt`.
+        start_turn (int, optional): Turns already completed in `messages`;
+                                    used to number logged turns.
+        router (ModelRouter, optional): If given, picks the model and output
+                                        budget for every turn instead of
+                                        `model_name`.
+        context_pack (str, optional): Repository context (see
+                                      context_packer.py) attached to the first
+                                      user message, so the model can skip the
+                                      usual listing and reading turns.
+
+    Returns:
+        dict: "final_response" (str or None), "messages" (the conversation),
+              "last_response" (the last GenerateContentResponse or None),
+              "turns" (number of model turns taken), "repeats_served" (tool
+              calls answered from a previous identical call), "turns_saved"
+              (iterations left unused because a cycle stopped the session) and
+              "stop_reason" ("solved", "no_function_calls", "cycle" or
+              "max_iterations").
+
+    Raises:
+        Exception: Any error from the model call or a malformed tool result.
+    """
+    if messages is None:
+        first_parts = [types.Part(text=user_prompt)]
+        if context_pack:
+            first_parts.append(types.Part(text=context_pack))
+        messages = [
+            types.Content(role="user", parts=first_parts),
+        ]
+
+    final_response_text = None
+    response = None
+    turns = 0
+    turns_saved = 0
+    stop_reason = "max_iterations"
+    loop_guard = LoopGuard(working_directory)
+
+    try:
+        for i in range(max_iterations):
+            if verbose:
+                print(f"\n--- Agent Turn {i+1}/{max_iterations} ---")
+
+            turns = i + 1
+            turn_start = len(messages)
+            workspace_changes = {}
+            turn_stop_reason = None
+            if router is not None:
+                response = router.generate_content(
+                    prompt_cache, client.models, messages, **(generation_config or {})
+                )
+                if verbose:
+                    print(f"Model tier: {router.turn_tiers[-1]} (phase: {router.phase()})")
+            else:
+                response = prompt_cache.generate_content(
+                    client.models,
+                    model_name,
+                    messages,
+                    max_output_tokens=MAX_OUTPUT_TOKENS,
+                    **(generation_config or {})
+                )
+
+            # Track if agent claims problem is solved
+            agent_claims_solved = False
+            verification_step_present = False
+
+            if response.candidates:
+                for candidate in response.candidates:
+                    messages.append(candidate.content)
+
+                    has_text_response = False
+                    if candidate.content.parts:
+                        for part in candidate.content.parts:
+                            if part.text:
+                                final_response_text = part.text
+                                has_text_response = True
+                                # Check for keywords indicating the agent claims the problem is solved
+                                solved_keywords = ["fixed", "resolved", "success", "solved", "completed", "corrected"]
+                                if any(kw in part.text.lower() for kw in solved_keywords):
+                                    agent_claims_solved = True
+                                break
+                    if has_text_response:
+                        break
+
+            if response.function_calls:
+                for function_call_part in response.function_calls:
+                    if verbose:
+                        print(f"Calling function: {function_call_part.name}({json.dumps(dict(function_call_part.args))})")
+                    else:
+                        print(f"{function_call_part.name}")
+
+                    # Identical calls against an unchanged workspace are answered
+                    # from the previous result instead of being executed again
+                    function_call_result_content = loop_guard.lookup(function_call_part)
+                    executed = function_call_result_content is None
+                    if executed:
+                        function_call_result_content = call_function(
+                            function_call_part, working_directory=working_directory
+                        )
+
+                    if not (function_call_result_content.parts and
+                            len(function_call_result_content.parts) > 0 and
+                            function_call_result_content.parts[0].function_response and
+                            function_call_result_content.parts[0].function_response.response is not None):
+                        raise ValueError("Unexpected structure in function_call_result from call_function.")
+
+                    actual_response_data = function_call_result_content.parts[0].function_response.response
+                    if executed:
+                        loop_guard.record(function_call_part, function_call_result_content)
+                        if (function_call_part.name == "write_file"
+                                and not str(actual_response_data.get("result", "Error:")).startswith("Error:")):
+                            workspace_changes[function_call_part.args["file_path"]] = function_call_part.args["content"]
+                    if router is not None:
+                        router.observe(function_call_part.name, actual_response_data)
+
+                    # Mark that a verification step was present if run_python_file was called
+                    if function_call_part.name == "run_python_file":
+                        verification_step_present = True
+
+                    if verbose:
+                        if "result" in actual_response_data:
+                            print(f"-> {actual_response_data['result']}")
+                        elif "error" in actual_response_data:
+                            print(f"-> ERROR: {actual_response_data['error']}")
+                        else:
+                            print(f"-> Raw function response: {actual_response_data}")
+
+                    messages.append(function_call_result_content)
+            else:
+                if verbose:
+                    print("Model returned no text and no function calls. Ending loop.")
+                turn_stop_reason = "no_function_calls"
+
+            # Only exit if agent claims problem is solved AND a verification step was present
+            if turn_stop_reason is None and agent_claims_solved and verification_step_present:
+                turn_stop_reason = "solved"
+
+            if turn_stop_reason is None:
+                loop_action = loop_guard.end_turn()
+                if loop_action == "hint":
+                    if verbose:
+                        print("Detected a cycle of repeated tool calls. Sending a corrective hint.")
+                    messages.append(types.Content(role="user", parts=[types.Part(text=CYCLE_HINT)]))
+                    if router is not None:
+                        router.escalate(router.turn_tiers[-1])
+                elif loop_action == "stop":
+                    turns_saved = max_iterations - turns
+                    if verbose:
+                        print("Model kept repeating the same tool calls after a hint. Ending loop.")
+                    turn_stop_reason = "cycle"
+
+            # Checkpoint the finished turn so a crash or the iteration cap does not lose it
+            if session_log is not None:
+                session_log.append_turn(start_turn + turns, messages[turn_start:], workspace_changes,
+                                        response.usage_metadata)
+
+            if turn_stop_reason is not None:
+                stop_reason = turn_stop_reason
+                break
+    finally:
+        # Pending write_file changes reach disk by the end of the session at the latest
+        get_workspace(working_directory).flush()
+
+    if session_log is not None:
+        session_log.finish(stop_reason, final_response_text)
+
+    return {
+        "final_response": final_response_text,
+        "messages": messages,
+        "last_response": response,
+        "turns": turns,
+        "repeats_served": loop_guard.repeats_served,
+        "turns_saved": turns_saved,
+        "stop_reason": stop_reason,
+    }
@@ -0,0 +1,232 @@
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from agent import run_agent
+from config import WORKING_DIRECTORY, BEST_OF_N_TEST_FILE, BEST_OF_N_TEMPERATURES
+from functions.run_python import run_limited
+from functions.workspace import get_workspace, release_workspace
+
+# ioctl request number for FICLONE (linux/fs.h): share all extents of one file
+# with another, copy-on-write. Supported by btrfs, XFS (reflink=1), bcachefs...
+FICLONE = 0x40049409
+
+# Never copied into snapshots nor compared when diffing
+IGNORED_NAMES = {"__pycache__"}
+
+
+def snapshot_workspace(working_directory, link_mode="auto"):
+    """
+    Makes a cheap copy of the workspace for one candidate session. The
+    snapshot is created next to the workspace, so reflinks and hardlinks stay
+    on the same filesystem.
+
+    Args:
+        working_directory (str): The workspace to snapshot.
+        link_mode (str, optional): How files are cloned:
+            "reflink"  - copy-on-write clone, fails if unsupported;
+            "hardlink" - shares inodes. Safe against write_file (which replaces
+                         files by rename) but NOT against scripts that modify
+                         existing workspace files in place;
+            "copy"     - a plain copy;
+            "auto"     - reflink where supported, otherwise copy. Default.
+
+    Returns:
+        str: The absolute path of the snapshot directory.
+    """
+    abs_working_directory = os.path.abspath(working_directory)
+    snapshot = tempfile.mkdtemp(
+        prefix=f".{os.path.basename(abs_working_directory)}-snapshot-",
+        dir=os.path.dirname(abs_working_directory),
+    )
+
+    for dirpath, dirnames, filenames in os.walk(abs_working_directory):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_NAMES]
+        relative_dir = os.path.relpath(dirpath, abs_working_directory)
+        target_dir = os.path.normpath(os.path.join(snapshot, relative_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for filename in filenames:
+            _clone_file(os.path.join(dirpath, filename), os.path.join(target_dir, filename), link_mode)
+
+    return snapshot
+
+
+def _clone_file(source, destination, link_mode):
+    if link_mode == "hardlink":
+        os.link(source, destination)
+        return
+    if link_mode == "copy":
+        shutil.copy2(source, destination)
+        return
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+    except OSError:
+        if link_mode == "reflink":
+            raise
+        shutil.copy2(source, destination)
+
+
+def workspace_manifest(root):
+    """
+    Returns {relative path: sha256 hex digest} for every file under `root`.
+    """
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_NAMES]
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            with open(full_path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            manifest[os.path.relpath(full_path, root)] = digest
+    return manifest
+
+
+def workspace_diff(base_manifest, snapshot):
+    """
+    Compares a snapshot against the manifest of the workspace it was taken from.
+
+    Returns:
+        dict: "changed" (sorted relative paths added or modified in the
+              snapshot) and "deleted" (sorted relative paths removed from it).
+    """
+    snapshot_manifest = workspace_manifest(snapshot)
+    changed = sorted(
+        path for path, digest in snapshot_manifest.items()
+        if base_manifest.get(path) != digest
+    )
+    deleted = sorted(path for path in base_manifest if path not in snapshot_manifest)
+    return {"changed": changed, "deleted": deleted}
+
+
+def apply_diff(working_directory, snapshot, diff, base_manifest):
+    """
+    Applies a snapshot's diff back to the workspace. Every changed file is
+    first staged next to its target, then all of them are renamed into place,
+    so a failure while staging leaves the workspace untouched.
+
+    Raises:
+        RuntimeError: If a touched file changed in the workspace since the
+                      snapshot was taken.
+    """
+    abs_working_directory = os.path.abspath(working_directory)
+    current_manifest = workspace_manifest(abs_working_directory)
+    for path in diff["changed"] + diff["deleted"]:
+        if current_manifest.get(path) != base_manifest.get(path):
+            raise RuntimeError(f'"{path}" changed in the workspace since the snapshot was taken')
+
+    staged = []
+    try:
+        for path in diff["changed"]:
+            target = os.path.join(abs_working_directory, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp_path = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.{uuid.uuid4().hex}.tmp")
+            shutil.copy2(os.path.join(snapshot, path), temp_path)
+            staged.append((temp_path, target))
+    except BaseException:
+        for temp_path, _ in staged:
+            os.unlink(temp_path)
+        raise
+
+    for temp_path, target in staged:
+        os.replace(temp_path, target)
+    for path in diff["deleted"]:
+        os.remove(os.path.join(abs_working_directory, path))
+
+
+def score_candidate(snapshot, test_file=BEST_OF_N_TEST_FILE):
+    """
+    Runs the test file inside a snapshot and summarises the outcome.
+
+    Returns:
+        dict: "passed" (bool), "failures" (failed + errored unittest cases,
+              or 1 if the run failed without a unittest summary) and
+              "wall_time" (float, seconds).
+    """
+    run = run_limited([sys.executable, test_file], snapshot)
+    output = run["stdout"] + run["stderr"]
+    passed = run["returncode"] == 0 and not run["timed_out"]
+
+    failures = 0
+    summary = re.search(r"FAILED \(([^)]*)\)", output)
+    if summary:
+        failures = sum(int(n) for n in re.findall(r"(?:failures|errors)=(\d+)", summary.group(1)))
+    elif not passed:
+        failures = 1
+
+    return {"passed": passed, "failures": failures, "wall_time": run["wall_time"]}
+
+
+def run_best_of_n(client, prompt_cache, user_prompt, n, working_directory=WORKING_DIRECTORY,
+                  test_file=BEST_OF_N_TEST_FILE, link_mode="auto", verbose=False, context_pack=None):
+    """
+    Runs `n` candidate fix sessions concurrently, each in its own snapshot of
+    the workspace, scores them by running `test_file`, and applies only the
+    best passing candidate's changes back to the workspace.
+
+    Candidates are ranked by: tests passed, fewest failing tests, having made
+    a change at all, then fastest test run.
+
+    `context_pack` is attached to every candidate's first message; its paths
+    are relative, so one pack of the original workspace fits every snapshot.
+
+    Returns:
+        dict: "candidates" (one dict per candidate with its "index",
+              "score", "diff", "final_response" and "error") and "winner"
+              (the applied candidate, or None if no candidate passed).
+    """
+    abs_working_directory = os.path.abspath(working_directory)
+    # Snapshots are taken from disk, so pending writes must be there first
+    get_workspace(abs_working_directory).flush()
+    base_manifest = workspace_manifest(abs_working_directory)
+    snapshots = [snapshot_workspace(abs_working_directory, link_mode) for _ in range(n)]
+
+    def run_candidate(index):
+        candidate = {"index": index, "final_response": None, "error": None}
+        try:
+            session = run_agent(
+                client,
+                prompt_cache,
+                user_prompt,
+                working_directory=snapshots[index],
+                verbose=verbose,
+                generation_config={"temperature": BEST_OF_N_TEMPERATURES[index % len(BEST_OF_N_TEMPERATURES)]},
+                context_pack=context_pack,
+            )
+            candidate["final_response"] = session["final_response"]
+        except Exception as e:
+            candidate["error"] = str(e)
+        candidate["diff"] = workspace_diff(base_manifest, snapshots[index])
+        candidate["score"] = score_candidate(snapshots[index], test_file)
+        return candidate
+
+    try:
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            candidates = list(pool.map(run_candidate, range(n)))
+
+        ranked = sorted(
+            candidates,
+            key=lambda c: (
+                not c["score"]["passed"],
+                c["score"]["failures"],
+                not (c["diff"]["changed"] or c["diff"]["deleted"]),
+                c["score"]["wall_time"],
+            ),
+        )
+        winner = ranked[0] if ranked and ranked[0]["score"]["passed"] else None
+        if winner:
+            apply_diff(abs_working_directory, snapshots[winner["index"]], winner["diff"], base_manifest)
+    finally:
+        for snapshot in snapshots:
+            release_workspace(snapshot)
+            shutil.rmtree(snapshot, ignore_errors=True)
+
+    return {"candidates": candidates, "winner": winner}
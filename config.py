@@ -1 +1,80 @@
-MAX_FILE_CHARS = 10000
\ No newline at end of file
+MAX_FILE_CHARS = 10000
+
+# Agent defaults
+WORKING_DIRECTORY = "./calculator"
+MODEL_NAME = "gemini-2.0-flash-001"
+MAX_ITERATIONS = 20
+MAX_OUTPUT_TOKENS = 2048
+
+# Context caching for the stable prompt prefix (system prompt + tool declarations)
+CONTEXT_CACHE_TTL_SECONDS = 3600
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 60
+# Smallest prefix the API will cache for the configured models; shorter
+# prefixes are sent inline without trying to create a cache entry
+CONTEXT_CACHE_MIN_TOKENS = 4096
+# Cache entries (one per model and session prefix) kept alive at once
+CONTEXT_CACHE_MAX_ENTRIES = 8
+
+# Resource limits applied to every run_python_file child process
+RUN_TIMEOUT_SECONDS = 30
+RUN_CPU_SECONDS = 20
+RUN_MEMORY_BYTES = 512 * 1024 * 1024
+RUN_MAX_OPEN_FILES = 256
+# RLIMIT_NPROC counts every process of the user, not just the child's own
+RUN_MAX_PROCESSES = 256
+
+# Best-of-N candidate fixes (main.py --best-of N)
+BEST_OF_N_TEST_FILE = "tests.py"
+# Temperatures handed out round-robin so candidates explore different fixes
+BEST_OF_N_TEMPERATURES = [0.2, 0.7, 1.0, 0.4, 0.9]
+
+# Long-running agent server (server.py)
+SERVER_SOCKET_PATH = "agent.sock"
+SERVER_WORKSPACE_ROOT = "."
+SERVER_MAX_CONCURRENT_SESSIONS = 4
+# Upper bound on the per-session iteration budget a client may request
+SERVER_MAX_ITERATIONS = 50
+
+# Loop detection in the agent loop (loop_guard.py)
+# Longest repeating pattern of turns that is recognised as a cycle
+LOOP_MAX_CYCLE_LENGTH = 3
+
+# Session checkpoint logs (session_log.py, main.py --resume)
+SESSION_LOG_DIR = ".agent_sessions"
+# fsync the log after this many records or this many seconds, whichever first
+SESSION_LOG_FSYNC_EVERY = 8
+SESSION_LOG_FSYNC_INTERVAL_SECONDS = 2.0
+
+# Compression of run_python_file output before it reaches the model
+RUN_OUTPUT_COMPRESSION = True
+# With --verbose, the uncompressed output of every compressed run is kept here
+RUN_OUTPUT_LOG_DIR = ".agent_runs"
+# Only the most recent raw output logs are kept
+RUN_OUTPUT_LOG_KEEP = 50
+
+# Per-turn model routing (router.py). Exploration and verification/summary
+# turns go to the fast tier, edit turns to the strong tier with a larger
+# output budget.
+MODEL_TIERS = {
+    "fast": {"model": "gemini-2.0-flash-lite-001", "max_output_tokens": 2048},
+    "strong": {"model": "gemini-2.0-flash-001", "max_output_tokens": 8192},
+}
+PHASE_TIERS = {
+    "exploration": "fast",
+    "edit": "strong",
+    "verification-summary": "fast",
+}
+# Turns that stay on the strong tier after a cheap turn fails or loops
+ROUTER_ESCALATION_TURNS = 2
+
+# Repository context packed into the first prompt (context_packer.py)
+CONTEXT_PACK_TOKEN_BUDGET = 4000
+# Rough characters-per-token ratio used to estimate sizes against the budget
+CONTEXT_PACK_CHARS_PER_TOKEN = 4
+# Share of the budget the file tree listing may use; the rest is summarised
+CONTEXT_PACK_TREE_SHARE = 0.25
+# Per-workspace analysis (identifiers, imports, outlines) cached by content hash
+CONTEXT_PACK_CACHE_DIR = ".agent_cache/context_pack"
+# Only the most recently used analyses are kept, on disk and in memory
+CONTEXT_PACK_CACHE_KEEP = 32
+CONTEXT_PACK_MEMORY_ENTRIES = 8
@@ -0,0 +1,287 @@
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from google.genai import types
+
+from config import (
+    CONTEXT_CACHE_TTL_SECONDS,
+    CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+    CONTEXT_CACHE_MIN_TOKENS,
+    CONTEXT_CACHE_MAX_ENTRIES,
+)
+
+# Rough characters-per-token ratio used to estimate the prefix size
+CHARS_PER_TOKEN = 4
+
+
+class ContextCache:
+    """
+    Keeps server-side cached-content entries for the stable prompt prefix so
+    it is uploaded once and referenced by name on every later turn.
+
+    The prefix is the system instruction and tool declarations plus, once a
+    session has more than one message, its first user message: the bug report
+    and the packed repository context (context_packer.py), which never change
+    during the session. Only the messages after it are sent with each call.
+
+    One entry is kept per model and first message, because cached content is
+    bound to the model it was created for. Entries are recreated shortly before
+    their TTL runs out, and only the `max_entries` most recently used are kept.
+    A prefix estimated below `min_tokens` is never uploaded; the call is sent
+    inline and counted in `below_minimum`. If creating an entry fails
+    (unsupported model, network error, ...) the cache disables itself for that
+    model and every call falls back to sending the full prefix inline.
+
+    Args:
+        caches: The cache service, normally `client.caches`. Anything with the
+                same `create(model=..., config=...)` / `delete(name=...)` methods
+                works, e.g. `LocalCacheService` below.
+        system_instruction (str): The system prompt to cache.
+        tools (list[types.Tool]): The tool declarations to cache.
+        ttl_seconds (int, optional): Lifetime requested for each cache entry.
+        clock (callable, optional): Returns the current time in seconds.
+                                    Overridable for tests.
+        min_tokens (int, optional): Minimum cacheable prefix size, in tokens.
+        max_entries (int, optional): Cache entries kept at once.
+    """
+
+    def __init__(self, caches, system_instruction, tools,
+                 ttl_seconds=CONTEXT_CACHE_TTL_SECONDS, clock=time.time,
+                 min_tokens=CONTEXT_CACHE_MIN_TOKENS, max_entries=CONTEXT_CACHE_MAX_ENTRIES):
+        self.caches = caches
+        self.system_instruction = system_instruction
+        self.tools = tools
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.base_tokens = (
+            len(system_instruction) + sum(len(tool.model_dump_json(exclude_none=True)) for tool in tools)
+        ) // CHARS_PER_TOKEN
+
+        # (model name, first-message digest) -> (cache name, expiry timestamp),
+        # least recently used first
+        self.entries = OrderedDict()
+        # model name -> reason caching was disabled
+        self.disabled = {}
+
+        # Token accounting across every call made through this cache
+        self.cached_tokens = 0
+        self.uncached_tokens = 0
+        # Calls sent inline because their prefix was too small to cache
+        self.below_minimum = 0
+
+        # Sessions running in parallel threads share one cache object
+        self.lock = threading.RLock()
+
+    def cache_name(self, model, prefix=()):
+        """
+        Returns the name of a live cache entry for `model` and the leading
+        `prefix` messages, creating or refreshing it if needed. Returns None
+        if caching is unavailable or the prefix is too small.
+        """
+        with self.lock:
+            return self._cache_name(model, list(prefix))
+
+    def _cache_name(self, model, prefix):
+        if self.caches is None or model in self.disabled:
+            return None
+
+        key = (model, _digest(prefix))
+        now = self.clock()
+        entry = self.entries.get(key)
+        if entry and now < entry[1] - CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+            self.entries.move_to_end(key)
+            return entry[0]
+
+        # Expired (or about to): drop the old entry before creating a new one
+        if entry:
+            self._delete(entry[0])
+            del self.entries[key]
+
+        prefix_tokens = self.base_tokens + sum(
+            len(content.model_dump_json(exclude_none=True)) for content in prefix
+        ) // CHARS_PER_TOKEN
+        if prefix_tokens < self.min_tokens:
+            # The API would reject it; do not pay a create round trip to find out
+            self.below_minimum += 1
+            return None
+
+        try:
+            cached = self.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=self.system_instruction,
+                    tools=self.tools,
+                    contents=prefix or None,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as e:
+            self.disabled[model] = str(e)
+            return None
+
+        self.entries[key] = (cached.name, now + self.ttl_seconds)
+        while len(self.entries) > self.max_entries:
+            _, (old_name, _) = self.entries.popitem(last=False)
+            self._delete(old_name)
+        return cached.name
+
+    def invalidate(self, model, prefix=()):
+        """Forgets the cache entry for `model` and `prefix` so the next call recreates it."""
+        with self.lock:
+            entry = self.entries.pop((model, _digest(list(prefix))), None)
+            if entry:
+                self._delete(entry[0])
+
+    def generate_content(self, models, model, contents, **config_kwargs):
+        """
+        Calls `models.generate_content` with the cached prefix when available,
+        or with the prefix inline otherwise, and records token usage.
+
+        If a request is rejected because its cache entry is missing or invalid
+        (e.g. evicted server-side), the entry is recreated once; if that also
+        fails, caching is disabled for the model and the call is retried
+        uncached. Any other error (rate limits, server errors, ...) is raised
+        unchanged and leaves the cache entry alone.
+
+        Args:
+            models: The model service, normally `client.models`.
+            model (str): The model name.
+            contents (list[types.Content]): The conversation so far.
+            **config_kwargs: Extra `GenerateContentConfig` fields
+                             (e.g. max_output_tokens).
+
+        Returns:
+            types.GenerateContentResponse: The model response.
+        """
+        # The first user message joins the cached prefix once something
+        # follows it; a request cannot consist of cached content alone
+        prefix = contents[:1] if len(contents) > 1 and contents[0].role == "user" else []
+
+        for attempt in range(2):
+            name = self.cache_name(model, prefix)
+            if name is None:
+                break
+            try:
+                response = models.generate_content(
+                    model=model,
+                    contents=contents[len(prefix):],
+                    config=types.GenerateContentConfig(cached_content=name, **config_kwargs),
+                )
+                self.record_usage(response.usage_metadata)
+                return response
+            except Exception as e:
+                if not is_cache_error(e):
+                    raise
+                self.invalidate(model, prefix)
+                if attempt == 1:
+                    with self.lock:
+                        self.disabled[model] = str(e)
+
+        response = models.generate_content(
+            model=model,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                tools=self.tools,
+                system_instruction=self.system_instruction,
+                **config_kwargs,
+            ),
+        )
+        self.record_usage(response.usage_metadata)
+        return response
+
+    def record_usage(self, usage_metadata):
+        """Adds one response's prompt tokens to the cached/uncached totals."""
+        if usage_metadata is None:
+            return
+        prompt_tokens = usage_metadata.prompt_token_count or 0
+        cached_tokens = usage_metadata.cached_content_token_count or 0
+        with self.lock:
+            self.cached_tokens += cached_tokens
+            self.uncached_tokens += max(prompt_tokens - cached_tokens, 0)
+
+    def close(self):
+        """Deletes every cache entry this object created."""
+        with self.lock:
+            for name, _ in self.entries.values():
+                self._delete(name)
+            self.entries.clear()
+
+    def _delete(self, name):
+        try:
+            self.caches.delete(name=name)
+        except Exception:
+            # The entry may already have expired server-side; nothing to do
+            pass
+
+
+def _digest(contents):
+    """Returns a stable key for a list of Contents."""
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(content.model_dump_json(exclude_none=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def is_cache_error(error):
+    """
+    Returns True if `error` says the referenced cached content is missing or
+    invalid, as opposed to a failure of the request itself.
+    """
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and (code == 429 or code >= 500):
+        return False
+    message = str(error).lower().replace(" ", "")
+    return "cachedcontent" in message or "cached_content" in message
+
+
+class LocalCacheService:
+    """
+    In-process stand-in for `client.caches`, for tests and offline runs.
+    Stores the cached config by name and honours the requested TTL.
+
+    Args:
+        clock (callable, optional): Returns the current time in seconds.
+        fail (bool, optional): If True, every `create` raises, simulating a
+                               model or account where caching is unavailable.
+    """
+
+    def __init__(self, clock=time.time, fail=False):
+        self.clock = clock
+        self.fail = fail
+        self.store = {}
+        self.create_calls = 0
+
+    def create(self, *, model, config=None):
+        self.create_calls += 1
+        if self.fail:
+            raise RuntimeError("Context caching is not available")
+
+        name = f"cachedContents/local-{self.create_calls}"
+        ttl_seconds = int(str(config.ttl).rstrip("s")) if config and config.ttl else CONTEXT_CACHE_TTL_SECONDS
+        expires_at = self.clock() + ttl_seconds
+        cached = types.CachedContent(
+            name=name,
+            model=model,
+            expire_time=datetime.datetime.fromtimestamp(expires_at, tz=datetime.timezone.utc),
+        )
+        self.store[name] = (cached, config, expires_at)
+        return cached
+
+    def get(self, *, name):
+        entry = self.store.get(name)
+        if entry is None or self.clock() >= entry[2]:
+            self.store.pop(name, None)
+            raise KeyError(f"Cached content not found: {name}")
+        return entry[0]
+
+    def get_config(self, name):
+        """Returns the cached system instruction/tools config for `name`."""
+        self.get(name=name)
+        return self.store[name][1]
+
+    def delete(self, *, name):
+        self.store.pop(name, None)
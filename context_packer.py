@@ -0,0 +1,321 @@
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+from config import (
+    MAX_FILE_CHARS,
+    CONTEXT_PACK_TOKEN_BUDGET,
+    CONTEXT_PACK_CHARS_PER_TOKEN,
+    CONTEXT_PACK_TREE_SHARE,
+    CONTEXT_PACK_CACHE_DIR,
+    CONTEXT_PACK_CACHE_KEEP,
+    CONTEXT_PACK_MEMORY_ENTRIES,
+)
+from functions.workspace import get_workspace
+
+PACK_HEADER = (
+    "Workspace overview, gathered automatically before your first turn. "
+    "Files shown in full are current; do not list or read them again unless you "
+    "have changed them. Files shown as outlines can be read with get_file_content."
+)
+
+# Words too common in bug reports to say anything about which file is relevant
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "when", "from", "not", "but",
+    "are", "was", "should", "instead", "gives", "get", "got", "fix", "bug",
+    "error", "wrong", "please", "file", "code", "python",
+}
+
+# workspace hash -> analysis, least recently used first
+_memory_cache = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+
+def pack_workspace_context(working_directory, user_prompt, token_budget=CONTEXT_PACK_TOKEN_BUDGET,
+                           cache_dir=CONTEXT_PACK_CACHE_DIR):
+    """
+    Builds the repository context attached to the first user message: a tree
+    listing of the workspace, then the files most relevant to the prompt in
+    full, or as outlines once full contents no longer fit in `token_budget`.
+    The listing counts against the budget; it may use CONTEXT_PACK_TREE_SHARE
+    of it, beyond which only the best-ranked files are listed.
+
+    Files are ranked by overlap between the prompt's words and each file's
+    name and identifiers, plus a bonus that falls off with import-graph
+    distance from the best-matching files (or from the entry points if
+    nothing matches directly).
+
+    The per-file analysis is cached in memory and on disk under the
+    workspace's content hash, so repeated sessions on an unchanged workspace
+    only re-rank. Both caches keep only the most recently used analyses
+    (CONTEXT_PACK_MEMORY_ENTRIES and CONTEXT_PACK_CACHE_KEEP).
+
+    Args:
+        working_directory (str): The workspace to pack.
+        user_prompt (str): The user's bug report.
+        token_budget (int, optional): Approximate token budget for the pack.
+        cache_dir (str, optional): Where analyses are cached; None disables
+                                   the on-disk cache.
+
+    Returns:
+        str: The packed context.
+    """
+    workspace = get_workspace(working_directory)
+    contents = {}
+    for path in workspace.walk_files():
+        try:
+            contents[path] = workspace.read_bytes(workspace.resolve(path))
+        except OSError:
+            continue
+
+    analysis = _load_analysis(contents, cache_dir)
+    ranking = rank_files(analysis, user_prompt)
+
+    budget_chars = token_budget * CONTEXT_PACK_CHARS_PER_TOKEN
+    sections = [PACK_HEADER, "Files:"]
+    sections.extend(_tree_listing(analysis["files"], ranking, int(budget_chars * CONTEXT_PACK_TREE_SHARE)))
+    used = sum(len(section) + 1 for section in sections)
+
+    for path, score in ranking:
+        if score <= 0:
+            break
+        info = analysis["files"][path]
+        if info["text"] and len(contents[path]) <= MAX_FILE_CHARS:
+            full = f"--- {path} (full) ---\n{contents[path].decode('utf-8')}"
+            if used + len(full) + 1 <= budget_chars:
+                sections.append(full)
+                used += len(full) + 1
+                continue
+        if info["outline"]:
+            outline = f"--- {path} (outline) ---\n" + "\n".join(info["outline"])
+            if used + len(outline) + 1 <= budget_chars:
+                sections.append(outline)
+                used += len(outline) + 1
+
+    return "\n".join(sections)
+
+
+def _tree_listing(files, ranking, budget_chars):
+    """
+    Returns one "- path (size)" line per file, in path order, keeping the
+    best-ranked files when the listing would exceed `budget_chars`; the rest
+    are summarised in a final "... N more files" line.
+    """
+    lines = {}
+    used = 0
+    for path, _ in ranking:
+        line = f"- {path} ({files[path]['size']} bytes)"
+        # Leave room for the summary line while files remain unlisted
+        reserve = 0 if len(lines) + 1 == len(files) else 40
+        if used + len(line) + 1 + reserve > budget_chars:
+            break
+        lines[path] = line
+        used += len(line) + 1
+
+    listing = [lines[path] for path in sorted(lines)]
+    if len(lines) < len(files):
+        listing.append(f"- ... {len(files) - len(lines)} more files not listed")
+    return listing
+
+
+def rank_files(analysis, user_prompt):
+    """
+    Returns [(path, score)] for every file, best first.
+    """
+    prompt_words = _words(user_prompt)
+    files = analysis["files"]
+
+    direct = {}
+    for path, info in files.items():
+        name_overlap = len(prompt_words & set(info["name_words"]))
+        identifier_overlap = len(prompt_words & set(info["identifier_words"]))
+        direct[path] = 3 * name_overlap + identifier_overlap
+
+    best = max(direct.values(), default=0)
+    if best > 0:
+        seeds = [path for path, score in direct.items() if score == best]
+    else:
+        seeds = [path for path, info in files.items() if info["entry_point"]]
+
+    distances = _import_distances(analysis["imports"], seeds)
+    scores = {
+        path: direct[path] + (1.0 / (1 + distances[path]) if path in distances else 0.0)
+        for path in files
+    }
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def _import_distances(imports, seeds):
+    # Undirected: a module's importers are as relevant as what it imports
+    neighbours = {}
+    for path, targets in imports.items():
+        for target in targets:
+            neighbours.setdefault(path, set()).add(target)
+            neighbours.setdefault(target, set()).add(path)
+
+    distances = {seed: 0 for seed in seeds}
+    queue = deque(seeds)
+    while queue:
+        path = queue.popleft()
+        for neighbour in neighbours.get(path, ()):
+            if neighbour not in distances:
+                distances[neighbour] = distances[path] + 1
+                queue.append(neighbour)
+    return distances
+
+
+def _load_analysis(contents, cache_dir):
+    digest = hashlib.sha256()
+    for path in sorted(contents):
+        digest.update(path.encode("utf-8") + b"\0" + hashlib.sha256(contents[path]).digest())
+    workspace_hash = digest.hexdigest()
+
+    with _memory_cache_lock:
+        if workspace_hash in _memory_cache:
+            _memory_cache.move_to_end(workspace_hash)
+            return _memory_cache[workspace_hash]
+
+    cache_path = os.path.join(cache_dir, f"{workspace_hash}.json") if cache_dir else None
+    analysis = None
+    if cache_path and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                analysis = json.load(f)
+            os.utime(cache_path) # Mark as recently used for pruning
+        except (OSError, ValueError):
+            analysis = None
+
+    if analysis is None:
+        analysis = _analyse(contents)
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(cache_path, "w", encoding="utf-8") as f:
+                    json.dump(analysis, f)
+                _prune_cache_dir(cache_dir)
+            except OSError:
+                pass # The cache is an optimisation only
+
+    with _memory_cache_lock:
+        _memory_cache[workspace_hash] = analysis
+        _memory_cache.move_to_end(workspace_hash)
+        while len(_memory_cache) > CONTEXT_PACK_MEMORY_ENTRIES:
+            _memory_cache.popitem(last=False)
+    return analysis
+
+
+def _prune_cache_dir(cache_dir):
+    """Deletes all but the CONTEXT_PACK_CACHE_KEEP most recently used analyses."""
+    cached = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if name.endswith(".json"):
+                cached.append((os.path.getmtime(path), path))
+        except OSError:
+            continue # Pruned concurrently
+    for _, old_path in sorted(cached)[:-CONTEXT_PACK_CACHE_KEEP]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+
+def _analyse(contents):
+    modules = {}
+    for path in contents:
+        if path.endswith(".py"):
+            module = path[:-3].replace(os.sep, ".")
+            if module.endswith(".__init__"):
+                module = module[:-len(".__init__")]
+            modules[module] = path
+
+    files = {}
+    imports = {}
+    for path, raw in contents.items():
+        info = {
+            "size": len(raw),
+            "text": True,
+            "name_words": sorted(_words(path)),
+            "identifier_words": [],
+            "outline": [],
+            "entry_point": False,
+        }
+        try:
+            text = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            info["text"] = False
+            files[path] = info
+            continue
+
+        if path.endswith(".py"):
+            try:
+                tree = ast.parse(text)
+            except SyntaxError:
+                tree = None
+            if tree is not None:
+                identifiers = set()
+                for node in ast.walk(tree):
+                    if isinstance(node, ast.Name):
+                        identifiers.add(node.id)
+                    elif isinstance(node, ast.Attribute):
+                        identifiers.add(node.attr)
+                    elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                        identifiers.add(node.name)
+                    elif isinstance(node, ast.Constant) and isinstance(node.value, str) and len(node.value) < 40:
+                        identifiers.add(node.value)
+                info["identifier_words"] = sorted(set().union(*(_words(i) for i in identifiers)) if identifiers else set())
+                info["outline"] = _outline(tree)
+                info["entry_point"] = "__main__" in identifiers
+                imports[path] = sorted(_resolve_imports(tree, path, modules))
+        files[path] = info
+
+    return {"files": files, "imports": imports}
+
+
+def _outline(tree):
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.append(f"def {node.name}({ast.unparse(node.args)})  [line {node.lineno}]")
+        elif isinstance(node, ast.ClassDef):
+            lines.append(f"class {node.name}  [line {node.lineno}]")
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    lines.append(f"    def {item.name}({ast.unparse(item.args)})  [line {item.lineno}]")
+    return lines
+
+
+def _resolve_imports(tree, path, modules):
+    package = os.path.dirname(path).replace(os.sep, ".")
+    targets = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parts = package.split(".") if package else []
+                parts = parts[:len(parts) - (node.level - 1)] if node.level > 1 else parts
+                base = ".".join(p for p in parts + ([base] if base else []) if p)
+            # "from pkg import render" may import the module pkg/render.py
+            names = [base] + [f"{base}.{alias.name}" if base else alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name in modules and modules[name] != path:
+                targets.add(modules[name])
+    return targets
+
+
+def _words(text):
+    """Splits text into lowercase words, breaking snake_case and camelCase."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return {
+        word for word in re.split(r"[^A-Za-z0-9]+", text.lower())
+        if len(word) > 2 and word not in STOPWORDS
+    }
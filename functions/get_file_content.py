@@ -1,6 +1,6 @@
-import os
 from config import MAX_FILE_CHARS # Import the MAX_FILE_CHARS from your config.py
 from google.genai import types
+from functions.workspace import get_workspace
 
 def get_file_content(working_directory, file_path):
     """
@@ -18,28 +18,22 @@ def get_file_content(working_directory, file_path):
              Error strings are prefixed with "Error:".
     """
     try:
-        # Resolve the absolute path of the working directory
-        abs_working_directory = os.path.abspath(working_directory)
-        
-        # Construct the full path to the target file
-        potential_full_path = os.path.join(abs_working_directory, file_path)
-        full_path = os.path.normpath(potential_full_path)
-        
-        # Crucial Security Guardrail:
-        # Ensure that the resolved full_path is a subdirectory of (or the same as)
-        # the abs_working_directory. This prevents the agent from accessing
-        # files/directories outside its designated workspace.
-        abs_full_path = os.path.abspath(full_path) # Get absolute path after normpath
-        if not abs_full_path.startswith(abs_working_directory):
+        # Resolve and validate the target through the shared workspace view.
+        # Crucial Security Guardrail: the workspace rejects any path whose
+        # common path with the workspace root is not the root itself, so the
+        # agent cannot reach files/directories outside its designated workspace
+        # (including sibling directories that merely share a name prefix).
+        workspace = get_workspace(working_directory)
+        abs_full_path = workspace.resolve(file_path)
+        if abs_full_path is None:
             return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
 
         # Validate that the target path is indeed a file, not a directory
-        if not os.path.isfile(abs_full_path):
+        if not workspace.isfile(abs_full_path):
             return f'Error: File not found or is not a regular file: "{file_path}"'
 
-        # Read the file content
-        with open(abs_full_path, "r", encoding="utf-8") as f:
-            file_content_string = f.read(MAX_FILE_CHARS + 1) # Read one more char to check if truncation is needed
+        # Read the file content (a pending write_file is visible immediately)
+        file_content_string = workspace.read(abs_full_path, MAX_FILE_CHARS + 1) # Read one more char to check if truncation is needed
 
         # Truncate if necessary and append a message
         if len(file_content_string) > MAX_FILE_CHARS:
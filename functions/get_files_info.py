@@ -1,5 +1,6 @@
 import os
 from google.genai import types
+from functions.workspace import get_workspace
 
 def get_files_info(working_directory, directory="."):
     """
@@ -19,41 +20,33 @@ def get_files_info(working_directory, directory="."):
              Error strings are prefixed with "Error:".
     """
     try:
-        # Resolve the absolute path of the working directory
-        abs_working_directory = os.path.abspath(working_directory)
-        
-        # Construct the full path to the target directory
-        # os.path.join safely combines paths, and os.path.normpath normalizes it
-        # (e.g., resolves "a/b/../c" to "a/c")
-        potential_full_path = os.path.join(abs_working_directory, directory)
-        full_path = os.path.normpath(potential_full_path)
-        
-        # Crucial Security Guardrail:
-        # Ensure that the resolved full_path is a subdirectory of (or the same as)
-        # the abs_working_directory. This prevents the agent from accessing
-        # files/directories outside its designated workspace.
-        abs_full_path = os.path.abspath(full_path) # Get absolute path after normpath
-        if not abs_full_path.startswith(abs_working_directory):
+        # Resolve and validate the target through the shared workspace view.
+        # Crucial Security Guardrail: the workspace rejects any path whose
+        # common path with the workspace root is not the root itself, so the
+        # agent cannot reach files/directories outside its designated workspace
+        # (including sibling directories that merely share a name prefix).
+        workspace = get_workspace(working_directory)
+        abs_full_path = workspace.resolve(directory)
+        if abs_full_path is None:
             return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
 
         # Validate that the target path is indeed a directory
-        if not os.path.isdir(abs_full_path):
+        if not workspace.isdir(abs_full_path):
             return f'Error: "{directory}" is not a directory'
 
-        # List the contents of the directory
-        contents = os.listdir(abs_full_path)
-        
         output_lines = []
-        # Sort the contents for consistent output order
-        for item_name in sorted(contents):
+        # The listing includes files with pending (not yet flushed) writes,
+        # already sorted for consistent output order
+        for item_name in workspace.listdir(abs_full_path):
             item_path = os.path.join(abs_full_path, item_name)
             
-            is_dir = os.path.isdir(item_path)
+            is_dir = workspace.isdir(item_path)
             
             file_size = 0
             try:
-                # os.path.getsize returns the size for both files and directories (on some systems)
-                file_size = os.path.getsize(item_path)
+                # Size of the pending content if there is a write_file not yet flushed,
+                # otherwise os.path.getsize (which also works for directories on some systems)
+                file_size = workspace.size(item_path)
             except OSError:
                 # If there's an error getting the size (e.g., permissions), default to 0
                 file_size = 0
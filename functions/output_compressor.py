@@ -0,0 +1,209 @@
+import os
+import re
+import threading
+import time
+import uuid
+
+from config import RUN_OUTPUT_LOG_DIR, RUN_OUTPUT_LOG_KEEP
+
+TRACEBACK_HEADER = "Traceback (most recent call last):"
+FRAME_PATTERN = re.compile(r'^  File "(?P<path>[^"]+)", line (?P<line>\d+)(?:, in (?P<func>.+))?$')
+RAN_PATTERN = re.compile(r"^Ran (?P<count>\d+) tests? in (?P<time>[\d.]+s)$")
+RESULT_PATTERN = re.compile(r"^(?P<status>OK|FAILED)(?: \((?P<details>[^)]*)\))?$")
+FAILURE_HEADER_PATTERN = re.compile(r"^(?P<kind>FAIL|ERROR): (?P<test>.+)$")
+VERBOSE_TEST_PATTERN = re.compile(r"^\S+ \([^)]*\)(?: \S.*)? \.\.\. (?:ok|skipped.*|expected failure)$")
+
+# Running totals across every compressed run, for --verbose reporting
+_stats_lock = threading.Lock()
+compression_stats = {"runs": 0, "raw_chars": 0, "compressed_chars": 0, "raw_logs": []}
+
+# Where raw output is saved; None (the default) keeps nothing on disk
+_raw_output_log_dir = None
+
+
+def compress_output(text, working_directory):
+    """
+    Shrinks a script's output before it is handed back to the model:
+
+    1. unittest output is rewritten to one summary line plus the failing
+       tests; progress dots, separators and passing tests are dropped.
+    2. Tracebacks keep only the frames inside the working directory (with
+       paths made relative to it) and the final exception; runs of frames
+       elsewhere (standard library, site-packages) become one marker line.
+    3. Consecutive identical lines are collapsed into one line with a count.
+
+    Args:
+        text (str): The raw stdout or stderr.
+        working_directory (str): The workspace the script ran in.
+
+    Returns:
+        str: The compressed text.
+    """
+    lines = text.splitlines()
+    lines = _compress_unittest(lines)
+    lines = _trim_tracebacks(lines, os.path.abspath(working_directory))
+    lines = _collapse_repeats(lines)
+    return "\n".join(lines)
+
+
+def _compress_unittest(lines):
+    ran_index = next((i for i, line in enumerate(lines) if RAN_PATTERN.match(line)), None)
+    if ran_index is None:
+        return lines
+
+    ran = RAN_PATTERN.match(lines[ran_index])
+    status = "unknown"
+    for line in lines[ran_index + 1:]:
+        result = RESULT_PATTERN.match(line.strip())
+        if result:
+            status = result.group("status")
+            if result.group("details"):
+                status += f" ({result.group('details')})"
+            break
+
+    summary = [f"unittest: {ran.group('count')} tests in {ran.group('time')}: {status}"]
+    kept = []
+    in_failure = False
+    for line in lines[:ran_index]:
+        if FAILURE_HEADER_PATTERN.match(line):
+            in_failure = True
+            kept.append(line)
+        elif set(line) <= {"="} or set(line) <= {"-"}:
+            # Separator lines; a dashed line right before "Ran" ends the last failure
+            continue
+        elif in_failure:
+            kept.append(line)
+        elif line and set(line) <= set(".FEsxu"):
+            continue # Progress line, e.g. "..F.E"
+        elif VERBOSE_TEST_PATTERN.match(line):
+            continue # A passing test in -v mode
+        else:
+            kept.append(line)
+
+    # Whatever unittest printed after the result line (rare) is kept as is
+    trailing = []
+    for i, line in enumerate(lines[ran_index + 1:]):
+        if RESULT_PATTERN.match(line.strip()):
+            trailing = lines[ran_index + 2 + i:]
+            break
+    return summary + kept + trailing
+
+
+def _trim_tracebacks(lines, abs_working_directory):
+    output = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.strip() != TRACEBACK_HEADER:
+            output.append(line)
+            i += 1
+            continue
+
+        output.append(line)
+        indent = line[:len(line) - len(line.lstrip())]
+        i += 1
+        skipped = 0
+        # Frames: a "File ..." line followed by indented source / caret lines
+        while i < len(lines) and lines[i].startswith(indent + "  "):
+            frame = FRAME_PATTERN.match(lines[i][len(indent):])
+            body = []
+            j = i + 1
+            while j < len(lines) and lines[j].startswith(indent + "    "):
+                body.append(lines[j])
+                j += 1
+            if frame is None:
+                output.extend(lines[i:j])
+            else:
+                path = frame.group("path")
+                full_path = os.path.normpath(os.path.join(abs_working_directory, path))
+                inside = (os.path.commonpath([abs_working_directory, full_path]) == abs_working_directory
+                          and os.path.exists(full_path))
+                if inside:
+                    if skipped:
+                        output.append(f"{indent}  ... {skipped} frame(s) outside the working directory omitted")
+                        skipped = 0
+                    relative = os.path.relpath(full_path, abs_working_directory)
+                    output.append(lines[i].replace(f'"{path}"', f'"{relative}"', 1))
+                    # Keep the source line, drop the ^^^^ caret markers
+                    output.extend(b for b in body if set(b.strip()) - set("^~ "))
+                else:
+                    skipped += 1
+            i = j
+        if skipped:
+            output.append(f"{indent}  ... {skipped} frame(s) outside the working directory omitted")
+        # The exception line(s) that follow are kept by the outer loop
+    return output
+
+
+def _collapse_repeats(lines):
+    output = []
+    i = 0
+    while i < len(lines):
+        j = i
+        while j + 1 < len(lines) and lines[j + 1] == lines[i]:
+            j += 1
+        count = j - i + 1
+        if count > 2:
+            output.append(f"{lines[i]}  [repeated {count} times]")
+        else:
+            output.extend(lines[i:j + 1])
+        i = j + 1
+    return output
+
+
+def keep_raw_output(log_dir=RUN_OUTPUT_LOG_DIR):
+    """Makes save_raw_output keep raw run output in `log_dir` (None disables it)."""
+    global _raw_output_log_dir
+    _raw_output_log_dir = log_dir
+
+
+def save_raw_output(file_path, stdout, stderr):
+    """
+    Writes a run's uncompressed output to the run log directory, if
+    keep_raw_output enabled one, and prunes all but the newest
+    RUN_OUTPUT_LOG_KEEP logs.
+
+    Returns:
+        str: The path of the log file, or None if raw output is not kept.
+    """
+    log_dir = _raw_output_log_dir
+    if log_dir is None:
+        return None
+    os.makedirs(log_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}-{os.path.basename(file_path)}.log"
+    path = os.path.join(log_dir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# {file_path}\nSTDOUT:\n{stdout}\nSTDERR:\n{stderr}\n")
+
+    logs = []
+    for log_name in os.listdir(log_dir):
+        log_path = os.path.join(log_dir, log_name)
+        try:
+            if log_name.endswith(".log"):
+                logs.append((os.path.getmtime(log_path), log_path))
+        except OSError:
+            continue # Pruned concurrently
+    for _, old_path in sorted(logs)[:-RUN_OUTPUT_LOG_KEEP]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+    with _stats_lock:
+        compression_stats["raw_logs"].append(path)
+    return path
+
+
+def record_compression(raw_chars, compressed_chars):
+    with _stats_lock:
+        compression_stats["runs"] += 1
+        compression_stats["raw_chars"] += raw_chars
+        compression_stats["compressed_chars"] += compressed_chars
+
+
+def compression_ratio():
+    """Returns raw/compressed characters over all runs so far (1.0 if none)."""
+    with _stats_lock:
+        if not compression_stats["compressed_chars"]:
+            return 1.0
+        return compression_stats["raw_chars"] / compression_stats["compressed_chars"]
@@ -1,12 +1,52 @@
+import json
 import os
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from google.genai import types
+from functions.workspace import get_workspace
+from functions.output_compressor import compress_output, record_compression, save_raw_output
+from config import (
+    RUN_TIMEOUT_SECONDS,
+    RUN_CPU_SECONDS,
+    RUN_MEMORY_BYTES,
+    RUN_MAX_OPEN_FILES,
+    RUN_MAX_PROCESSES,
+    RUN_OUTPUT_COMPRESSION,
+)
 
-def run_python_file(working_directory, file_path, args=None):
+# Default per-run caps; any subset can be overridden through `limits`
+DEFAULT_RUN_LIMITS = {
+    "timeout": RUN_TIMEOUT_SECONDS,
+    "cpu_seconds": RUN_CPU_SECONDS,
+    "memory_bytes": RUN_MEMORY_BYTES,
+    "open_files": RUN_MAX_OPEN_FILES,
+    "processes": RUN_MAX_PROCESSES,
+}
+
+# Runs in a fresh interpreter between fork and the real program: applies the
+# rlimits given as JSON in argv[1], then execs argv[2:]. This replaces a
+# preexec_fn, which is unsafe to use from a multithreaded parent.
+LIMIT_WRAPPER = """
+import json, os, resource, sys
+for name, value in json.loads(sys.argv[1]):
+    rlimit = getattr(resource, name)
+    _, hard = resource.getrlimit(rlimit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(rlimit, (value, hard if hard != resource.RLIM_INFINITY else value))
+os.execvp(sys.argv[2], sys.argv[2:])
+"""
+
+def run_python_file(working_directory, file_path, args=None, limits=None):
     """
     Executes a Python file within a specified working directory, capturing its output.
-    Includes security guardrails, a timeout, and robust error handling.
+    Includes security guardrails, a timeout, per-run resource limits and robust
+    error handling. The whole process group is killed once the script exits
+    or times out, so nothing it spawned outlives the run.
 
     Args:
         working_directory (str): The absolute or relative path to the base directory
@@ -15,31 +55,38 @@ def run_python_file(working_directory, file_path, args=None):
                          within the working_directory.
         args (list, optional): A list of strings representing command-line arguments
                                to pass to the executed Python script. Defaults to [].
+        limits (dict, optional): Overrides for DEFAULT_RUN_LIMITS ("timeout",
+                                 "cpu_seconds", "memory_bytes", "open_files",
+                                 "processes"). A value of None disables that
+                                 rlimit cap; "timeout" must always be set.
 
     Returns:
         str: A formatted string containing the script's stdout, stderr, and exit code,
              or an error message (prefixed with "Error:") if something went wrong.
-             Returns "No output produced." if both stdout and stderr are empty.
+             Reports "No output produced." if both stdout and stderr are empty.
+             Output is compressed (see output_compressor.compress_output); when
+             that shrinks it, a short note gives the ratio. Always ends with a "Resources:" line giving wall time,
+             user/sys CPU time and peak RSS of the child process.
     """
     if args is None:
         args = []
+    limits = {**DEFAULT_RUN_LIMITS, **(limits or {})}
 
     try:
-        # Resolve the absolute path of the working directory
-        abs_working_directory = os.path.abspath(working_directory)
-        
-        # Construct the full path to the target file
-        potential_full_path = os.path.join(abs_working_directory, file_path)
-        full_path = os.path.normpath(potential_full_path)
-        
-        # Crucial Security Guardrail:
-        # Ensure that the resolved full_path is a subdirectory of (or the same as)
-        # the abs_working_directory. This prevents the agent from executing
-        # files/directories outside its designated workspace.
-        abs_full_path = os.path.abspath(full_path) # Get absolute path after normpath
-        if not abs_full_path.startswith(abs_working_directory):
+        # Resolve and validate the target through the shared workspace view.
+        # Crucial Security Guardrail: the workspace rejects any path whose
+        # common path with the workspace root is not the root itself, so the
+        # agent cannot execute files outside its designated workspace
+        # (including sibling directories that merely share a name prefix).
+        workspace = get_workspace(working_directory)
+        abs_working_directory = workspace.root
+        abs_full_path = workspace.resolve(file_path)
+        if abs_full_path is None:
             return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
 
+        # The script must see every pending write_file
+        workspace.flush()
+
         # Validate that the target path is indeed an existing file
         if not os.path.isfile(abs_full_path):
             return f'Error: File "{file_path}" not found.'
@@ -52,50 +99,171 @@ def run_python_file(working_directory, file_path, args=None):
         # Using 'python3' for explicit Python 3 execution, common in WSL/Linux environments
         command = [sys.executable, abs_full_path] + list(args)
 
-        # Execute the Python file using subprocess.run
-        # - timeout: prevents infinite execution
-        # - capture_output: captures stdout and stderr
-        # - text=True: decodes stdout/stderr as text (UTF-8 by default)
-        # - cwd: sets the current working directory for the subprocess
-        process = subprocess.run(
-            command,
-            timeout=30,  # 30-second timeout
-            capture_output=True,
-            text=True,
-            cwd=abs_working_directory,
-            check=False # Do not raise CalledProcessError for non-zero exit codes, handle manually
-        )
+        run = run_limited(command, abs_working_directory, limits)
+        stdout, stderr, returncode = run["stdout"], run["stderr"], run["returncode"]
+
+        resource_line = format_resource_usage(run["wall_time"], run["usage"])
+
+        if run["timed_out"]:
+            return (f"Error: Execution of '{file_path}' timed out after {limits['timeout']} seconds.\n"
+                    f"{resource_line}")
+
+        # Collapse repeated lines, trim tracebacks to workspace frames and
+        # summarise unittest output. The raw text may be kept on disk for the
+        # local --verbose report; its path is outside the workspace, so the
+        # model is not told about it.
+        raw_output = stdout.strip() + stderr.strip()
+        compression_note = None
+        if RUN_OUTPUT_COMPRESSION and raw_output:
+            stdout = compress_output(stdout.strip(), abs_working_directory)
+            stderr = compress_output(stderr.strip(), abs_working_directory)
+            compressed_chars = len(stdout) + len(stderr)
+            record_compression(len(raw_output), compressed_chars)
+            if compressed_chars < len(raw_output):
+                save_raw_output(file_path, run["stdout"], run["stderr"])
+                compression_note = f"[Output compressed {len(raw_output) / max(compressed_chars, 1):.1f}x]"
 
         output_lines = []
-        if process.stdout:
+        if stdout:
             output_lines.append("STDOUT:")
-            output_lines.append(process.stdout.strip())
+            output_lines.append(stdout.strip())
         
-        if process.stderr:
+        if stderr:
             output_lines.append("STDERR:")
-            output_lines.append(process.stderr.strip())
+            output_lines.append(stderr.strip())
 
-        if process.returncode != 0:
-            output_lines.append(f"Process exited with code {process.returncode}")
+        if compression_note:
+            output_lines.append(compression_note)
+
+        if returncode != 0:
+            output_lines.append(f"Process exited with code {returncode}")
+            if returncode < 0:
+                # Killed by a signal, e.g. SIGXCPU/SIGKILL once the CPU limit is hit
+                output_lines.append(f"Process killed by {signal.Signals(-returncode).name}")
 
         if not output_lines:
-            return "No output produced."
-        
+            output_lines.append("No output produced.")
+
+        output_lines.append(resource_line)
         return "\n".join(output_lines)
 
-    except subprocess.TimeoutExpired:
-        return f"Error: Execution of '{file_path}' timed out after 30 seconds."
     except FileNotFoundError:
         return f'Error: Python interpreter or file "{file_path}" not found.'
     except Exception as e:
         # Catch any other unexpected errors during setup or execution
         return f"Error: executing Python file: {e}"
 
+
+def run_limited(command, cwd, limits=None):
+    """
+    Runs `command` under the given resource limits and reaps it with os.wait4.
+    Shared by run_python_file and anything else that executes workspace code
+    (e.g. scoring best-of-N candidates).
+
+    Args:
+        command (list): The command line to execute.
+        cwd (str): The directory to run it in.
+        limits (dict, optional): Overrides for DEFAULT_RUN_LIMITS.
+
+    Returns:
+        dict: "stdout" and "stderr" (str), "returncode" (int), "timed_out"
+              (bool), "wall_time" (float, seconds) and "usage" (the child's
+              resource.struct_rusage).
+    """
+    limits = {**DEFAULT_RUN_LIMITS, **(limits or {})}
+
+    # Capture output in temporary files rather than pipes so we can reap the
+    # child ourselves with os.wait4 (which also returns its resource usage)
+    # without risking a pipe-buffer deadlock.
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+        start_time = time.monotonic()
+
+        # - start_new_session: puts the child in its own process group so it
+        #   can be killed together with anything it spawned
+        # - the limit wrapper applies the setrlimit caps, then execs `command`
+        #   in the same process, so wait4 still reports the program's usage
+        # - cwd: sets the current working directory for the subprocess
+        process = subprocess.Popen(
+            _limit_resources(command, limits),
+            stdin=subprocess.DEVNULL,
+            stdout=stdout_file,
+            stderr=stderr_file,
+            cwd=cwd,
+            start_new_session=True,
+        )
+
+        timed_out = threading.Event()
+
+        def kill_process_group():
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        def on_timeout():
+            timed_out.set()
+            kill_process_group()
+
+        timer = threading.Timer(limits["timeout"], on_timeout)
+        timer.start()
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        finally:
+            timer.cancel()
+            # Whatever the child left running in its group (e.g. a grandchild
+            # that survived a CPU-limit kill) goes with it
+            kill_process_group()
+
+        wall_time = time.monotonic() - start_time
+        # We reaped the child ourselves; tell Popen so it does not try again
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        stdout_file.seek(0)
+        stdout = stdout_file.read().decode("utf-8", errors="replace")
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode("utf-8", errors="replace")
+
+    return {
+        "stdout": stdout,
+        "stderr": stderr,
+        "returncode": process.returncode,
+        "timed_out": timed_out.is_set(),
+        "wall_time": wall_time,
+        "usage": usage,
+    }
+
+
+def _limit_resources(command, limits):
+    """
+    Wraps `command` in LIMIT_WRAPPER with the CPU, address-space, open-file
+    and process caps. A limit of None leaves that resource untouched. Limits
+    are clamped to the current hard limit, which an unprivileged process
+    cannot raise.
+    """
+    caps = [
+        ("RLIMIT_CPU", limits["cpu_seconds"]),
+        ("RLIMIT_AS", limits["memory_bytes"]),
+        ("RLIMIT_NOFILE", limits["open_files"]),
+        ("RLIMIT_NPROC", limits["processes"]),
+    ]
+    caps = [(name, value) for name, value in caps if value is not None]
+    return [sys.executable, "-c", LIMIT_WRAPPER, json.dumps(caps), command[0]] + list(command[1:])
+
+
+def format_resource_usage(wall_time, usage):
+    """
+    Formats the child's wall time, user/sys CPU time and peak RSS
+    (from os.wait4's rusage; ru_maxrss is in kilobytes on Linux).
+    """
+    return (f"Resources: wall={wall_time:.3f}s user={usage.ru_utime:.3f}s "
+            f"sys={usage.ru_stime:.3f}s peak_rss={usage.ru_maxrss / 1024:.1f}MB")
+
 # Function Declaration for the LLM to understand how to call run_python_file
 schema_run_python_file = types.FunctionDeclaration(
     name="run_python_file",
     description="Executes a Python file within the working directory, capturing its standard output and error. "
-                "The execution is limited to 30 seconds.",
+                f"The execution is limited to {RUN_TIMEOUT_SECONDS} seconds of wall time, with caps on CPU time "
+                "and memory. The result ends with the run's wall time, CPU time and peak memory.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
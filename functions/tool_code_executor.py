@@ -1,6 +1,7 @@
 import os
 import json # For pretty printing arguments in verbose mode
 from google.genai import types
+from config import WORKING_DIRECTORY
 
 # Import the actual function implementations
 from functions.get_files_info import get_files_info
@@ -8,7 +9,7 @@ from functions.get_file_content import get_file_content
 from functions.run_python import run_python_file
 from functions.write_file import write_file
 
-def call_function(function_call_part, verbose=False):
+def call_function(function_call_part, verbose=False, working_directory=WORKING_DIRECTORY):
     """
     Handles the abstract task of calling one of our four defined functions.
     It automatically injects the working_directory and formats the response
@@ -19,24 +20,27 @@ def call_function(function_call_part, verbose=False):
                                                  from the LLM's response.
         verbose (bool, optional): If True, prints detailed function call info.
                                   Defaults to False.
+        working_directory (str, optional): The workspace the tool is confined to.
+                                           Chosen by the caller, never by the LLM.
+                                           Defaults to WORKING_DIRECTORY.
 
     Returns:
         types.Content: A Content object representing the result of the
                        function call, or an error.
     """
-    # Hardcoded working directory for security.
-    # This ensures the LLM cannot manipulate the base directory.
-    working_directory = "./calculator"
-
     function_name = function_call_part.name
     
     # Convert args from MessageMap (immutable) to a mutable dictionary
     function_args = dict(function_call_part.args) 
 
-    # Add the hardcoded working_directory to the arguments.
+    # Add the caller's working_directory to the arguments.
     # The LLM doesn't specify this for security reasons, so we inject it.
     function_args["working_directory"] = working_directory
 
+    # Resource limits for run_python_file come from config.py only; never let
+    # the model raise its own caps.
+    function_args.pop("limits", None)
+
     # --- CHANGE STARTS HERE ---
     if verbose:
         # Detailed output for verbose mode
@@ -0,0 +1,198 @@
+import os
+import shutil
+import threading
+import uuid
+
+# Directories never walked as workspace content: bytecode caches and virtual
+# environments, plus every dot-directory (.git, .venv, .agent_sessions, ...)
+IGNORED_NAMES = {"__pycache__", "venv", "node_modules"}
+
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+
+
+def get_workspace(working_directory):
+    """
+    Returns the shared Workspace for `working_directory`, creating it on first
+    use. Every tool resolves its working_directory through this, so all of
+    them see the same pending writes.
+    """
+    root = os.path.abspath(working_directory)
+    with _workspaces_lock:
+        workspace = _workspaces.get(root)
+        if workspace is None:
+            workspace = _workspaces[root] = Workspace(root)
+        return workspace
+
+
+def release_workspace(working_directory):
+    """Flushes and forgets the Workspace for `working_directory`, if any."""
+    with _workspaces_lock:
+        workspace = _workspaces.pop(os.path.abspath(working_directory), None)
+    if workspace is not None:
+        workspace.flush()
+
+
+class Workspace:
+    """
+    Write-back view of one working directory, shared by every tool.
+
+    Paths are resolved and validated once, with os.path.commonpath semantics:
+    a path is inside the workspace only if the workspace root is its common
+    path with the root, so a sibling such as "calculator2" is rejected, unlike
+    with a plain string-prefix check.
+
+    Writes go to an in-memory overlay and are visible to reads and listings
+    immediately. flush() writes them to disk in one batch: every file is first
+    written to a temporary file next to its target, then all of them are
+    renamed into place. run_python_file flushes before executing anything.
+
+    Every write bumps a generation counter and records which path changed, so
+    caches can ask what changed since they last looked (changed_since).
+
+    Args:
+        root (str): The workspace directory.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.overlay = {}
+        self.generation = 0
+        self.changed_at = {}
+        self.lock = threading.RLock()
+
+    def resolve(self, path):
+        """
+        Returns the absolute, normalized path of `path` (relative to the root),
+        or None if it is outside the workspace.
+        """
+        full_path = os.path.normpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full_path]) != self.root:
+            return None
+        return full_path
+
+    def relative(self, full_path):
+        return os.path.relpath(full_path, self.root)
+
+    def isfile(self, full_path):
+        with self.lock:
+            return full_path in self.overlay or os.path.isfile(full_path)
+
+    def isdir(self, full_path):
+        with self.lock:
+            if os.path.isdir(full_path):
+                return True
+            prefix = full_path.rstrip(os.sep) + os.sep
+            return any(pending.startswith(prefix) for pending in self.overlay)
+
+    def read(self, full_path, max_chars=None):
+        """
+        Returns the file's text, from the overlay if it has a pending write.
+        Reads at most `max_chars` characters when given.
+
+        Raises:
+            FileNotFoundError, IsADirectoryError, PermissionError: As open().
+        """
+        with self.lock:
+            if full_path in self.overlay:
+                content = self.overlay[full_path]
+                return content if max_chars is None else content[:max_chars]
+        with open(full_path, "r", encoding="utf-8") as f:
+            return f.read() if max_chars is None else f.read(max_chars)
+
+    def read_bytes(self, full_path):
+        """Returns the file's raw bytes, from the overlay if it has a pending write."""
+        with self.lock:
+            if full_path in self.overlay:
+                return self.overlay[full_path].encode("utf-8")
+        with open(full_path, "rb") as f:
+            return f.read()
+
+    def size(self, full_path):
+        with self.lock:
+            if full_path in self.overlay:
+                return len(self.overlay[full_path].encode("utf-8"))
+        return os.path.getsize(full_path)
+
+    def listdir(self, full_path):
+        """Returns the names in a directory, including entries that only exist as pending writes."""
+        with self.lock:
+            names = set(os.listdir(full_path)) if os.path.isdir(full_path) else set()
+            prefix = full_path.rstrip(os.sep) + os.sep
+            for pending in self.overlay:
+                if pending.startswith(prefix):
+                    names.add(pending[len(prefix):].split(os.sep, 1)[0])
+            return sorted(names)
+
+    def walk_files(self):
+        """
+        Returns the relative paths of every file in the workspace, overlay
+        included. Directories in IGNORED_NAMES and dot-directories are skipped.
+        """
+        with self.lock:
+            paths = set()
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if d not in IGNORED_NAMES and not d.startswith(".")]
+                for filename in filenames:
+                    paths.add(self.relative(os.path.join(dirpath, filename)))
+            paths.update(self.relative(pending) for pending in self.overlay)
+            return sorted(paths)
+
+    def write(self, full_path, content):
+        """
+        Stages a write in the overlay.
+
+        Raises:
+            IsADirectoryError: If the target is a directory.
+            NotADirectoryError: If one of its parents is a file.
+        """
+        with self.lock:
+            if self.isdir(full_path):
+                raise IsADirectoryError(f"Is a directory: '{self.relative(full_path)}'")
+            parent = os.path.dirname(full_path)
+            while parent != self.root:
+                if self.isfile(parent):
+                    raise NotADirectoryError(f"Not a directory: '{self.relative(parent)}'")
+                parent = os.path.dirname(parent)
+
+            self.overlay[full_path] = content
+            self.generation += 1
+            self.changed_at[self.relative(full_path)] = self.generation
+
+    def changed_since(self, generation):
+        """Returns the relative paths written after `generation`."""
+        with self.lock:
+            return {path for path, changed in self.changed_at.items() if changed > generation}
+
+    def flush(self):
+        """
+        Writes every pending file to disk. Each file is written to a temporary
+        file next to its target, then all of them are renamed into place; the
+        rename replaces the directory entry, so hardlinked snapshots are never
+        modified through a shared inode.
+        """
+        with self.lock:
+            if not self.overlay:
+                return
+
+            staged = []
+            try:
+                for full_path, content in self.overlay.items():
+                    target_directory = os.path.dirname(full_path)
+                    os.makedirs(target_directory, exist_ok=True)
+                    temp_path = os.path.join(
+                        target_directory, f".{os.path.basename(full_path)}.{uuid.uuid4().hex}.tmp"
+                    )
+                    with open(temp_path, "x", encoding="utf-8") as f:
+                        f.write(content)
+                    staged.append((temp_path, full_path))
+                    if os.path.exists(full_path):
+                        shutil.copymode(full_path, temp_path) # Keep the original permissions
+            except BaseException:
+                for temp_path, _ in staged:
+                    os.unlink(temp_path)
+                raise
+
+            for temp_path, full_path in staged:
+                os.replace(temp_path, full_path)
+            self.overlay.clear()
@@ -1,11 +1,13 @@
-import os
-from google.genai import types 
+from google.genai import types
+from functions.workspace import get_workspace
 
 def write_file(working_directory, file_path, content):
     """
     Writes or overwrites content to a file within a specified working directory.
     Includes security guardrails to prevent access outside the working_directory,
     creates parent directories if necessary, and provides clear feedback.
+    The write is staged in the shared workspace overlay and flushed to disk
+    before the next run_python_file (or at the end of the session).
 
     Args:
         working_directory (str): The absolute or relative path to the base directory
@@ -19,29 +21,23 @@ def write_file(working_directory, file_path, content):
              or an error message (prefixed with "Error:") if something went wrong.
     """
     try:
-        # Resolve the absolute path of the working directory
-        abs_working_directory = os.path.abspath(working_directory)
-        
-        # Construct the full path to the target file
-        potential_full_path = os.path.join(abs_working_directory, file_path)
-        full_path = os.path.normpath(potential_full_path)
-        
-        # Crucial Security Guardrail:
-        # Ensure that the resolved full_path is a subdirectory of (or the same as)
-        # the abs_working_directory. This prevents the agent from accessing
-        # files/directories outside its designated workspace.
-        abs_full_path = os.path.abspath(full_path) # Get absolute path after normpath
-        if not abs_full_path.startswith(abs_working_directory):
+        # Resolve and validate the target through the shared workspace view.
+        # Crucial Security Guardrail: the workspace rejects any path whose
+        # common path with the workspace root is not the root itself, so the
+        # agent cannot reach files/directories outside its designated workspace
+        # (including sibling directories that merely share a name prefix).
+        workspace = get_workspace(working_directory)
+        abs_full_path = workspace.resolve(file_path)
+        if abs_full_path is None:
             return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
 
-        # Ensure the directory for the file exists
-        target_directory = os.path.dirname(abs_full_path)
-        if not os.path.exists(target_directory):
-            os.makedirs(target_directory, exist_ok=True) # Create all necessary parent directories
-
-        # Write the content to the file, overwriting existing content
-        with open(abs_full_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        # Stage the write in the workspace overlay. Reads see it right away;
+        # it reaches disk (parent directories included) in the next batched
+        # flush, which writes a temporary file next to the target and renames
+        # it into place. The rename is atomic, and it replaces the directory
+        # entry instead of writing through it, so a hardlinked workspace
+        # snapshot never changes the file it shares an inode with.
+        workspace.write(abs_full_path, content)
 
         return f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
     
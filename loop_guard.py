@@ -0,0 +1,152 @@
+import hashlib
+import json
+from google.genai import types
+
+from config import LOOP_MAX_CYCLE_LENGTH
+from functions.workspace import get_workspace
+
+# Tools whose effect is the point of calling them; never answered from cache
+SIDE_EFFECT_FUNCTIONS = {"write_file"}
+
+# Tools that may change files behind the workspace's back, so every file has
+# to be re-hashed afterwards (write_file changes are tracked by the workspace)
+EXTERNALLY_CHANGING_FUNCTIONS = {"run_python_file"}
+
+CYCLE_HINT = (
+    "You are repeating the same tool calls without making progress. "
+    "Do not call the same functions again with the same arguments: either change "
+    "your approach (read a different file, apply a fix with write_file) or give "
+    "your final answer now."
+)
+
+
+class LoopGuard:
+    """
+    Detects redundant and looping tool calls within one agent session.
+
+    Every call is fingerprinted by its name, its arguments and the state of the
+    workspace. An identical call against an unchanged workspace is answered with
+    the previous result, tagged as a repeat, instead of being executed again.
+
+    Each turn's calls form a turn signature. When the last few turns repeat the
+    turns right before them (a cycle of up to LOOP_MAX_CYCLE_LENGTH turns), the
+    guard first asks for a corrective hint to be sent to the model; if the model
+    keeps cycling after the hint, it asks for the session to stop.
+
+    Args:
+        working_directory (str): The session's workspace.
+    """
+
+    def __init__(self, working_directory):
+        self.workspace = get_workspace(working_directory)
+        self.results = {}
+        self.turn_signatures = []
+        self.current_turn = []
+        self.hint_sent = False
+
+        # relative path -> content digest, and the workspace generation they reflect
+        self.file_digests = None
+        self.seen_generation = 0
+        self.workspace_state = None
+
+        self.repeats_served = 0
+
+    def workspace_fingerprint(self):
+        """
+        Returns a digest of every file's path and content. Content rather than
+        mtime, so rewriting a file with the same text counts as no change.
+        Only files the workspace reports as written since the last call are
+        re-hashed; everything is re-hashed after a script has run.
+        """
+        if self.file_digests is None:
+            self.seen_generation = self.workspace.generation
+            self.file_digests = {}
+            for path in self.workspace.walk_files():
+                self._hash_file(path)
+            self.workspace_state = None
+        else:
+            generation = self.workspace.generation
+            changed = self.workspace.changed_since(self.seen_generation)
+            self.seen_generation = generation
+            for path in changed:
+                self._hash_file(path)
+            if changed:
+                self.workspace_state = None
+
+        if self.workspace_state is None:
+            digest = hashlib.sha256()
+            for path, file_digest in sorted(self.file_digests.items()):
+                digest.update(path.encode("utf-8") + b"\0" + file_digest)
+            self.workspace_state = digest.hexdigest()
+        return self.workspace_state
+
+    def _hash_file(self, path):
+        try:
+            content = self.workspace.read_bytes(self.workspace.resolve(path))
+        except OSError:
+            self.file_digests.pop(path, None)
+            return
+        self.file_digests[path] = hashlib.sha256(content).digest()
+
+    def fingerprint(self, function_call_part):
+        arguments = json.dumps(dict(function_call_part.args or {}), sort_keys=True, default=str)
+        return f"{function_call_part.name}:{arguments}:{self.workspace_fingerprint()}"
+
+    def lookup(self, function_call_part):
+        """
+        Returns a tool response for a repeated call, or None if the call has to
+        be executed. Either way the call counts towards the current turn.
+        """
+        key = self.fingerprint(function_call_part)
+        self.current_turn.append(key)
+
+        if function_call_part.name in SIDE_EFFECT_FUNCTIONS or key not in self.results:
+            return None
+
+        self.repeats_served += 1
+        previous = self.results[key]
+        return types.Content(
+            role="tool",
+            parts=[
+                types.Part.from_function_response(
+                    name=function_call_part.name,
+                    response={
+                        **previous,
+                        "repeat": True,
+                        "note": "Identical call against an unchanged workspace; "
+                                "this is the result of the previous call.",
+                    },
+                )
+            ],
+        )
+
+    def record(self, function_call_part, result_content):
+        """Stores the result of an executed call under its pre-call fingerprint."""
+        key = self.current_turn[-1]
+        self.results[key] = dict(result_content.parts[0].function_response.response)
+        if function_call_part.name in EXTERNALLY_CHANGING_FUNCTIONS:
+            self.file_digests = None
+
+    def end_turn(self):
+        """
+        Closes the current turn and checks for a cycle.
+
+        Returns:
+            str or None: "hint" the first time a cycle is detected, "stop" if
+                         the model cycles again after the hint, otherwise None.
+        """
+        if not self.current_turn:
+            return None
+        self.turn_signatures.append(tuple(self.current_turn))
+        self.current_turn = []
+
+        signatures = self.turn_signatures
+        for length in range(1, LOOP_MAX_CYCLE_LENGTH + 1):
+            if len(signatures) >= 2 * length and signatures[-length:] == signatures[-2 * length:-length]:
+                if self.hint_sent:
+                    return "stop"
+                self.hint_sent = True
+                # Start afresh so the hint gets a chance before the next check
+                self.turn_signatures = []
+                return "hint"
+        return None
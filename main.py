@@ -1,66 +1,80 @@
 import os
 import sys
-import json
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
 
-# Import all function schemas
-from functions.get_files_info import schema_get_files_info
-from functions.get_file_content import schema_get_file_content
-from functions.run_python import schema_run_python_file
-from functions.write_file import schema_write_file
+from agent import SYSTEM_PROMPT, AVAILABLE_FUNCTIONS, run_agent
+from best_of_n import run_best_of_n
+from context_cache import ContextCache
+from context_packer import pack_workspace_context
+from router import ModelRouter
+from session_log import SessionLog, load_session, restore_workspace
+from functions.output_compressor import compression_stats, compression_ratio, keep_raw_output
+from config import WORKING_DIRECTORY, MODEL_NAME, RUN_OUTPUT_LOG_DIR
 
-# Import the call_function from our executor module
-from functions.tool_code_executor import call_function
+USAGE = ("Usage: uv run main.py \"Your prompt here\" [--verbose] [--best-of N]\n"
+         "       uv run main.py --resume <session> [--verbose]")
 
 
 def main():
     verbose = False 
+    best_of = 1
+    user_prompt = None
+    resume = None
+
+    options = sys.argv[1:]
+    while options:
+        option = options.pop(0)
+        if option == "--verbose":
+            verbose = True
+        elif option == "--best-of" and options and options[0].isdigit() and int(options[0]) > 0:
+            best_of = int(options.pop(0))
+        elif option == "--best-of":
+            print("Error: --best-of requires a positive number of candidates.")
+            print(USAGE)
+            sys.exit(1)
+        elif option == "--resume" and options:
+            resume = options.pop(0)
+        elif option == "--resume":
+            print("Error: --resume requires a session id.")
+            print(USAGE)
+            sys.exit(1)
+        elif user_prompt is None and not option.startswith("--"):
+            user_prompt = option
+        else:
+            print(f"Error: Unknown argument '{option}'. Did you mean --verbose?")
+            print(USAGE)
+            sys.exit(1)
 
-    if len(sys.argv) < 2:
+    if user_prompt is None and resume is None:
         print("Error: Please provide a prompt as a command-line argument.")
-        print("Usage: uv run main.py \"Your prompt here\" [--verbose]")
+        print(USAGE)
         sys.exit(1)
 
-    user_prompt = sys.argv[1] 
+    if resume is not None and (user_prompt is not None or best_of > 1):
+        print("Error: --resume cannot be combined with a prompt or --best-of.")
+        print(USAGE)
+        sys.exit(1)
 
-    if len(sys.argv) > 2:
-        if sys.argv[2] == "--verbose":
-            verbose = True
-        else:
-            print(f"Error: Unknown argument '{sys.argv[2]}'. Did you mean --verbose?")
-            print("Usage: uv run main.py \"Your prompt here\" [--verbose]")
+    resumed_state = None
+    if resume is not None:
+        try:
+            resumed_state = load_session(resume)
+        except (OSError, ValueError) as e:
+            print(f"Error: Cannot resume session '{resume}': {e}")
             sys.exit(1)
 
-    # --- STRICT SYSTEM PROMPT ---
-    system_prompt = """
-You are a helpful AI coding agent. Your ONLY goal is to debug and FIX Python code in the existing codebase, specifically in the working directory.
-
-When a user reports a bug:
-1. **Understand the problem**: Analyze the user's bug description and expected vs. actual output.
-2. **Inspect files**: Use `get_files_info` to list files and `get_file_content` to read relevant code files (e.g., `calculator/pkg/calculator.py`).
-3. **Identify the bug**: Pinpoint the exact location and cause of the error in the code.
-4. **Apply the fix**: Use ONLY `write_file` to update the problematic file (e.g., `calculator/pkg/calculator.py`) with the corrected code. DO NOT create new files unless explicitly requested.
-5. **Verify the fix**: Use `run_python_file` to execute the affected script (e.g., `calculator/main.py`) with the original problematic input to confirm the bug is resolved and the output matches the expected result.
-6. **Final Answer**: Once the bug is confirmed to be fixed, provide a clear, concise explanation of what the bug was, how you fixed it, and the verification result.
-
-You MUST update the actual code file containing the bug. Do NOT write a new file or script unless the user asks for it. All paths should be relative to the working directory (`./calculator`). The working directory is automatically injected for security reasons.
-"""
-    # --- END STRICT SYSTEM PROMPT ---
-
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_files_info,
-            schema_get_file_content,
-            schema_run_python_file,
-            schema_write_file,
-        ]
-    )
-
-    messages = [
-        types.Content(role="user", parts=[types.Part(text=user_prompt)]),
-    ]
+        end = resumed_state["end"]
+        if end and end["stop_reason"] in ("solved", "no_function_calls"):
+            # Nothing left to do; answer from the log without calling the model
+            print(f"Session '{resume}' already finished ({end['stop_reason']}).")
+            print("\nFinal response:")
+            print(end["final_response"] or "Agent did not produce a final text response.")
+            return
+
+        user_prompt = resumed_state["prompt"]
+        for error in restore_workspace(resumed_state):
+            print(error)
 
     load_dotenv()
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -69,99 +83,93 @@ You MUST update the actual code file containing the bug. Do NOT write a new file
         print("Error: GEMINI_API_KEY not found in .env file or environment variables.")
         sys.exit(1)
 
-    model_name = "gemini-2.0-flash-001"
     client = genai.Client(api_key=api_key)
 
+    # Upload the system prompt and tool declarations once and reference them
+    # by name on later turns; falls back to inline prefix if caching fails.
+    prompt_cache = ContextCache(client.caches, SYSTEM_PROMPT, [AVAILABLE_FUNCTIONS])
+
+    # Exploration and summary turns on the fast tier, edit turns on the strong one.
+    # A resumed session keeps the tiers it was started with and picks up in the
+    # phase its logged tool calls had reached.
+    if resumed_state is not None and resumed_state["tiers"]:
+        router = ModelRouter(tiers=resumed_state["tiers"])
+    else:
+        router = ModelRouter()
+    if resumed_state is not None:
+        router.replay(resumed_state["messages"])
+
     print("Hello from ai-agent-project!")
 
     if verbose:
+        # Raw output of compressed runs is only kept for this report
+        keep_raw_output(RUN_OUTPUT_LOG_DIR)
         print(f"User prompt: {user_prompt}")
-        print(f"System instruction: {system_prompt}") 
+        print(f"System instruction: {SYSTEM_PROMPT}")
 
-    final_response_text = None
-    verification_passed = False
-    max_iterations = 20
-
-
-    for i in range(max_iterations):
+    # A resumed session already has its packed context in the logged first message
+    context_pack = None
+    if resumed_state is None:
+        context_pack = pack_workspace_context(WORKING_DIRECTORY, user_prompt)
         if verbose:
-            print(f"\n--- Agent Turn {i+1}/{max_iterations} ---")
-
-        try:
-            response = client.models.generate_content(
-                model=model_name,
-                contents=messages,
-                config=types.GenerateContentConfig(
-                    tools=[available_functions],
-                    system_instruction=system_prompt,
-                    max_output_tokens=2048
-                )
-            )
-
-            # Track if agent claims problem is solved
-            agent_claims_solved = False
-            verification_step_present = False
-
-            if response.candidates:
-                for candidate in response.candidates:
-                    messages.append(candidate.content)
-
-                    has_text_response = False
-                    if candidate.content.parts:
-                        for part in candidate.content.parts:
-                            if part.text:
-                                final_response_text = part.text
-                                has_text_response = True
-                                # Check for keywords indicating the agent claims the problem is solved
-                                solved_keywords = ["fixed", "resolved", "success", "solved", "completed", "corrected"]
-                                if any(kw in part.text.lower() for kw in solved_keywords):
-                                    agent_claims_solved = True
-                                break
-                    if has_text_response:
-                        break
-
-            if response.function_calls:
-                for function_call_part in response.function_calls:
-                    if verbose:
-                        print(f"Calling function: {function_call_part.name}({json.dumps(dict(function_call_part.args))})")
-                    else:
-                        print(f"{function_call_part.name}")
-
-                    function_call_result_content = call_function(function_call_part)
-
-                    if not (function_call_result_content.parts and
-                            len(function_call_result_content.parts) > 0 and
-                            function_call_result_content.parts[0].function_response and
-                            function_call_result_content.parts[0].function_response.response is not None):
-                        raise ValueError("Unexpected structure in function_call_result from call_function.")
-
-                    actual_response_data = function_call_result_content.parts[0].function_response.response
-
-                    # Mark that a verification step was present if run_python_file was called
-                    if function_call_part.name == "run_python_file":
-                        verification_step_present = True
-
-                    if verbose:
-                        if "result" in actual_response_data:
-                            print(f"-> {actual_response_data['result']}")
-                        elif "error" in actual_response_data:
-                            print(f"-> ERROR: {actual_response_data['error']}")
-                        else:
-                            print(f"-> Raw function response: {actual_response_data}")
-
-                    messages.append(function_call_result_content)
+            print(f"Packed repository context: {len(context_pack)} characters")
+
+    try:
+        if best_of > 1:
+            outcome = run_best_of_n(client, prompt_cache, user_prompt, best_of, verbose=verbose,
+                                    context_pack=context_pack)
+            for candidate in outcome["candidates"]:
+                score = candidate["score"]
+                print(f"Candidate {candidate['index'] + 1}: tests {'passed' if score['passed'] else 'failed'}, "
+                      f"failures={score['failures']}, test time={score['wall_time']:.3f}s, "
+                      f"changed={candidate['diff']['changed'] + candidate['diff']['deleted']}"
+                      + (f", error={candidate['error']}" if candidate["error"] else ""))
+            winner = outcome["winner"]
+            if winner:
+                print(f"Applied candidate {winner['index'] + 1} to the workspace.")
             else:
-                if verbose:
-                    print("Model returned no text and no function calls. Ending loop.")
-                break
+                print("No candidate passed the tests; the workspace was left unchanged.")
+            session = {
+                "final_response": winner["final_response"] if winner else None,
+                "messages": [],
+                "last_response": None,
+            }
+        elif resumed_state is not None:
+            session_log = SessionLog(resumed_state["path"])
+            print(f"Resuming session {session_log.session_id} after {resumed_state['turns']} completed turns")
+            try:
+                session = run_agent(
+                    client,
+                    prompt_cache,
+                    user_prompt,
+                    working_directory=resumed_state["working_directory"],
+                    verbose=verbose,
+                    session_log=session_log,
+                    messages=resumed_state["messages"],
+                    start_turn=resumed_state["turns"],
+                    router=router,
+                )
+            finally:
+                session_log.close()
+        else:
+            session_log = SessionLog.create(user_prompt, WORKING_DIRECTORY, MODEL_NAME, context=context_pack,
+                                           tiers=router.tiers)
+            print(f"Session: {session_log.session_id} (resume with --resume {session_log.session_id})")
+            try:
+                session = run_agent(client, prompt_cache, user_prompt, verbose=verbose,
+                                    session_log=session_log, router=router, context_pack=context_pack)
+            finally:
+                session_log.close()
+    except Exception as e:
+        print(f"An error occurred during agent execution: {e}")
+        prompt_cache.close()
+        sys.exit(1)
 
-            # Only exit if agent claims problem is solved AND a verification step was present
-            if agent_claims_solved and verification_step_present:
-                break
+    prompt_cache.close()
 
-        except Exception as e:
-            print(f"An error occurred during agent execution: {e}")
-            sys.exit(1)
+    final_response_text = session["final_response"]
+    messages = session["messages"]
+    response = session["last_response"]
 
     print("\nFinal response:")
     if final_response_text:
@@ -173,12 +181,37 @@ You MUST update the actual code file containing the bug. Do NOT write a new file
             for msg in messages[-5:]:
                 print(msg)
 
-    if verbose and 'response' in locals() and response.usage_metadata:
+    if verbose and response is not None and response.usage_metadata:
         print(f"\nPrompt tokens (last turn): {response.usage_metadata.prompt_token_count}")
         print(f"Response tokens (last turn): {response.usage_metadata.candidates_token_count}")
     elif verbose:
         print("\nUsage metadata not available for the final turn.")
 
+    if verbose and best_of == 1:
+        print(f"Repeated tool calls answered from a previous result: {session['repeats_served']}")
+        print(f"Turns saved by loop detection: {session['turns_saved']}")
+        for tier, stats in router.stats.items():
+            if stats["turns"]:
+                print(f"Tier {tier} ({router.tiers[tier]['model']}): {stats['turns']} calls, "
+                      f"{stats['latency']:.2f}s total latency, {stats['prompt_tokens']} prompt tokens, "
+                      f"{stats['output_tokens']} output tokens, {stats['escalations']} escalations")
+
+    if verbose and compression_stats["runs"]:
+        print(f"Run output compression: {compression_stats['raw_chars']} -> "
+              f"{compression_stats['compressed_chars']} characters over {compression_stats['runs']} runs "
+              f"({compression_ratio():.1f}x)")
+        for raw_path in compression_stats["raw_logs"]:
+            print(f"Raw output: {raw_path}")
+
+    if verbose:
+        print(f"Prompt tokens served from cache (all turns): {prompt_cache.cached_tokens}")
+        print(f"Prompt tokens sent uncached (all turns): {prompt_cache.uncached_tokens}")
+        if prompt_cache.below_minimum:
+            print(f"Calls sent inline because the prefix was below the cacheable minimum: "
+                  f"{prompt_cache.below_minimum}")
+        for cached_model, reason in prompt_cache.disabled.items():
+            print(f"Context caching unavailable for {cached_model}: {reason}")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+import time
+
+from config import MODEL_TIERS, PHASE_TIERS, ROUTER_ESCALATION_TURNS
+
+
+class ModelRouter:
+    """
+    Picks a model tier for every agent turn from the phase the session is in:
+
+        exploration          - nothing read yet but listings   -> PHASE_TIERS["exploration"]
+        edit                 - source read, no untested write  -> PHASE_TIERS["edit"]
+        verification-summary - a fix was written; run it and
+                               report                          -> PHASE_TIERS["verification-summary"]
+
+    A failed verification run sends the session back to the edit phase.
+
+    A cheap turn is escalated to the edit tier (and the session stays there for
+    ROUTER_ESCALATION_TURNS turns) when the model call raises, when it returns
+    neither text nor function calls, or when the loop guard detects a cycle.
+
+    Latency, prompt tokens and output tokens are recorded per tier.
+
+    Args:
+        tiers (dict, optional): tier name -> {"model", "max_output_tokens"}.
+        phase_tiers (dict, optional): phase name -> tier name.
+        clock (callable, optional): Monotonic clock in seconds, for latency.
+    """
+
+    def __init__(self, tiers=MODEL_TIERS, phase_tiers=PHASE_TIERS, clock=time.monotonic):
+        self.tiers = tiers
+        self.phase_tiers = phase_tiers
+        self.escalation_tier = phase_tiers["edit"]
+        self.clock = clock
+
+        self.read_source = False
+        self.wrote_fix = False
+        self.escalated_turns = 0
+
+        self.stats = {
+            name: {"turns": 0, "latency": 0.0, "prompt_tokens": 0, "output_tokens": 0, "escalations": 0}
+            for name in tiers
+        }
+        self.turn_tiers = []
+
+    def phase(self):
+        if self.wrote_fix:
+            return "verification-summary"
+        if self.read_source:
+            return "edit"
+        return "exploration"
+
+    def choose_tier(self):
+        """Returns the tier for the next turn."""
+        if self.escalated_turns > 0:
+            self.escalated_turns -= 1
+            return self.escalation_tier
+        return self.phase_tiers[self.phase()]
+
+    def escalate(self, tier=None):
+        """Moves the next ROUTER_ESCALATION_TURNS turns to the escalation tier."""
+        if tier is not None and tier != self.escalation_tier:
+            self.stats[tier]["escalations"] += 1
+        self.escalated_turns = ROUTER_ESCALATION_TURNS
+
+    def generate_content(self, prompt_cache, models, contents, **config_kwargs):
+        """
+        Runs one turn on the chosen tier, escalating a failed cheap turn and
+        retrying it once on the escalation tier.
+
+        Returns:
+            types.GenerateContentResponse: The model response.
+        """
+        tier = self.choose_tier()
+        while True:
+            settings = self.tiers[tier]
+            start_time = self.clock()
+            try:
+                response = prompt_cache.generate_content(
+                    models,
+                    settings["model"],
+                    contents,
+                    max_output_tokens=settings["max_output_tokens"],
+                    **config_kwargs
+                )
+            except Exception:
+                self._record(tier, self.clock() - start_time, None)
+                if tier == self.escalation_tier:
+                    raise
+                self.escalate(tier)
+                tier = self.escalation_tier
+                continue
+
+            self._record(tier, self.clock() - start_time, response.usage_metadata)
+            if tier != self.escalation_tier and not _has_output(response):
+                self.escalate(tier)
+                tier = self.escalation_tier
+                continue
+
+            self.turn_tiers.append(tier)
+            return response
+
+    def observe(self, function_name, response_data):
+        """Updates the session phase from one tool call and its response."""
+        result = str(response_data.get("result", response_data.get("error", "Error:")))
+        failed = "error" in response_data or result.startswith("Error:")
+
+        if function_name == "get_file_content" and not failed:
+            self.read_source = True
+        elif function_name == "write_file" and not failed:
+            self.read_source = True
+            self.wrote_fix = True
+        elif function_name == "run_python_file" and self.wrote_fix:
+            if failed or "Process exited with code" in result or "FAILED" in result:
+                # The fix did not hold; back to editing on the strong tier
+                self.wrote_fix = False
+
+    def replay(self, messages):
+        """
+        Rebuilds the session phase from an existing conversation (e.g. one
+        loaded from a session log) by observing every tool response in it.
+        """
+        for content in messages:
+            for part in content.parts or []:
+                if part.function_response is not None:
+                    self.observe(part.function_response.name, part.function_response.response or {})
+
+    def _record(self, tier, latency, usage_metadata):
+        stats = self.stats[tier]
+        stats["turns"] += 1
+        stats["latency"] += latency
+        if usage_metadata is not None:
+            stats["prompt_tokens"] += usage_metadata.prompt_token_count or 0
+            stats["output_tokens"] += usage_metadata.candidates_token_count or 0
+
+
+def _has_output(response):
+    for candidate in response.candidates or []:
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if part.text or part.function_call:
+                return True
+    return False
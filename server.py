@@ -0,0 +1,265 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from dotenv import load_dotenv
+from google import genai
+
+from agent import SYSTEM_PROMPT, AVAILABLE_FUNCTIONS, run_agent
+from config import (
+    MAX_ITERATIONS,
+    SERVER_SOCKET_PATH,
+    SERVER_WORKSPACE_ROOT,
+    SERVER_MAX_CONCURRENT_SESSIONS,
+    SERVER_MAX_ITERATIONS,
+)
+from context_cache import ContextCache
+from context_packer import pack_workspace_context
+from router import ModelRouter
+
+USAGE = "Usage: uv run server.py [--socket PATH | --port N]"
+
+
+class AgentServer:
+    """
+    Long-running agent server. Keeps one model client, one context cache and a
+    pool of session worker threads alive across requests, and runs each
+    session's blocking agent loop on that pool from an asyncio event loop.
+
+    Protocol: newline-delimited JSON over a Unix socket or TCP. Each request
+    line gets exactly one response line; a connection may send many requests.
+
+        {"op": "run", "prompt": "...", "workspace": "calculator", "max_iterations": 10}
+            -> {"final_response": "...", "turns": 3, "repeats_served": 0,
+                "turns_saved": 0, "tiers": {...}, "workspace": "/abs/calculator"}
+        {"op": "metrics"}
+            -> {"queue_depth": 0, "in_flight": 1, "completed": 5, "failed": 0, ...}
+
+    "workspace" is required. Errors are reported as {"error": "..."}.
+
+    Args:
+        client: The model client shared by every session (`client.models`
+                and, if present, `client.caches` are used).
+        workspace_root (str, optional): Sessions may only use workspaces
+                                        inside this directory.
+        max_concurrent_sessions (int, optional): Sessions running at once;
+                                                 the rest wait in the queue.
+    """
+
+    def __init__(self, client, workspace_root=SERVER_WORKSPACE_ROOT,
+                 max_concurrent_sessions=SERVER_MAX_CONCURRENT_SESSIONS):
+        self.client = client
+        self.workspace_root = os.path.abspath(workspace_root)
+        self.prompt_cache = ContextCache(getattr(client, "caches", None), SYSTEM_PROMPT, [AVAILABLE_FUNCTIONS])
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_sessions, thread_name_prefix="agent-session"
+        )
+        self.slots = asyncio.Semaphore(max_concurrent_sessions)
+        self.busy_workspaces = set()
+        self.server = None
+
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+
+    def resolve_workspace(self, workspace):
+        """
+        Returns the absolute path of `workspace` (relative to workspace_root).
+
+        Raises:
+            ValueError: If it is the workspace root itself (which may hold the
+                        server's own files), outside it, or not a directory.
+        """
+        full_path = os.path.abspath(os.path.join(self.workspace_root, workspace))
+        if os.path.commonpath([self.workspace_root, full_path]) != self.workspace_root:
+            raise ValueError(f'Workspace "{workspace}" is outside the server workspace root')
+        if full_path == self.workspace_root:
+            raise ValueError(f'Workspace "{workspace}" must be a directory inside the server workspace root')
+        if not os.path.isdir(full_path):
+            raise ValueError(f'Workspace "{workspace}" is not a directory')
+        return full_path
+
+    async def run_session(self, request):
+        """Runs one agent session described by a "run" request."""
+        prompt = request.get("prompt")
+        if not isinstance(prompt, str) or not prompt:
+            raise ValueError('"prompt" must be a non-empty string')
+
+        # Required, and never the root itself, which would hand the agent the server's own tree
+        workspace = request.get("workspace")
+        if not isinstance(workspace, str) or not workspace:
+            raise ValueError('"workspace" must be a non-empty string')
+        working_directory = self.resolve_workspace(workspace)
+        max_iterations = min(int(request.get("max_iterations", MAX_ITERATIONS)), SERVER_MAX_ITERATIONS)
+        if max_iterations < 1:
+            raise ValueError('"max_iterations" must be at least 1')
+
+        # Two sessions editing the same files would trample each other, including
+        # when one workspace is nested inside the other
+        for busy in self.busy_workspaces:
+            if os.path.commonpath([busy, working_directory]) in (busy, working_directory):
+                raise ValueError(f'Workspace "{working_directory}" overlaps "{busy}", which is in use by another session')
+        self.busy_workspaces.add(working_directory)
+
+        try:
+            self.queue_depth += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.queue_depth -= 1
+
+            self.in_flight += 1
+            router = ModelRouter()
+            try:
+                loop = asyncio.get_running_loop()
+                context_pack = await loop.run_in_executor(
+                    self.executor, pack_workspace_context, working_directory, prompt
+                )
+                session = await loop.run_in_executor(
+                    self.executor,
+                    partial(
+                        run_agent,
+                        self.client,
+                        self.prompt_cache,
+                        prompt,
+                        working_directory=working_directory,
+                        max_iterations=max_iterations,
+                        router=router,
+                        context_pack=context_pack,
+                    ),
+                )
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.slots.release()
+        finally:
+            self.busy_workspaces.discard(working_directory)
+
+        return {
+            "final_response": session["final_response"],
+            "turns": session["turns"],
+            "repeats_served": session["repeats_served"],
+            "turns_saved": session["turns_saved"],
+            "tiers": router.stats,
+            "workspace": working_directory,
+        }
+
+    def metrics(self):
+        """Returns the current queue, in-flight and completion counters."""
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cached_tokens": self.prompt_cache.cached_tokens,
+            "uncached_tokens": self.prompt_cache.uncached_tokens,
+        }
+
+    async def handle_request(self, request):
+        op = request.get("op")
+        if op == "run":
+            return await self.run_session(request)
+        if op == "metrics":
+            return self.metrics()
+        raise ValueError(f"Unknown op: {op}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object")
+                    response = await self.handle_request(request)
+                except Exception as e:
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, socket_path=None, host="127.0.0.1", port=None):
+        """Starts listening on a Unix socket, or on TCP if `port` is given."""
+        if port is not None:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        else:
+            socket_path = socket_path or SERVER_SOCKET_PATH
+            if os.path.exists(socket_path):
+                os.remove(socket_path) # Stale socket from a previous run
+            self.server = await asyncio.start_unix_server(self.handle_connection, socket_path)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+        self.prompt_cache.close()
+
+
+async def send_request(request, socket_path=None, host="127.0.0.1", port=None):
+    """
+    Client helper: sends one request to a running AgentServer and returns
+    the decoded response.
+    """
+    if port is not None:
+        reader, writer = await asyncio.open_connection(host, port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(socket_path or SERVER_SOCKET_PATH)
+    try:
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def main():
+    socket_path = None
+    port = None
+
+    options = sys.argv[1:]
+    while options:
+        option = options.pop(0)
+        if option == "--socket" and options:
+            socket_path = options.pop(0)
+        elif option == "--port" and options and options[0].isdigit():
+            port = int(options.pop(0))
+        else:
+            print(f"Error: Unknown argument '{option}'.")
+            print(USAGE)
+            sys.exit(1)
+
+    load_dotenv()
+    api_key = os.environ.get("GEMINI_API_KEY")
+
+    if not api_key:
+        print("Error: GEMINI_API_KEY not found in .env file or environment variables.")
+        sys.exit(1)
+
+    async def serve():
+        server = AgentServer(genai.Client(api_key=api_key))
+        await server.start(socket_path=socket_path, port=port)
+        print(f"Agent server listening on {f'port {port}' if port is not None else socket_path or SERVER_SOCKET_PATH}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
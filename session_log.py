@@ -0,0 +1,214 @@
+import json
+import os
+import time
+import uuid
+from google.genai import types
+
+from config import SESSION_LOG_DIR, SESSION_LOG_FSYNC_EVERY, SESSION_LOG_FSYNC_INTERVAL_SECONDS
+from functions.write_file import write_file
+from functions.workspace import get_workspace
+
+
+class SessionLog:
+    """
+    Append-only JSONL checkpoint log for one agent session.
+
+    Record types, one JSON object per line:
+        {"type": "session", "prompt", "working_directory", "model", "context", "tiers", "created"}
+        {"type": "turn", "turn", "messages", "workspace_changes", "usage"}
+        {"type": "end", "stop_reason", "final_response"}
+
+    "messages" holds every Content appended to the conversation during the
+    turn (model content, tool results, corrective hints). "workspace_changes"
+    maps each file written by write_file during the turn to its new content.
+
+    Every record is flushed to the OS immediately, but fsync is batched: it runs
+    once SESSION_LOG_FSYNC_EVERY records are pending or
+    SESSION_LOG_FSYNC_INTERVAL_SECONDS have passed, and on close. A crash can
+    therefore lose at most the last unsynced turns, which are simply re-run.
+
+    Args:
+        path (str): The log file; appended to if it already exists. A torn
+                    last line left by a crash is cut off before appending.
+    """
+
+    def __init__(self, path, fsync_every=SESSION_LOG_FSYNC_EVERY,
+                 fsync_interval=SESSION_LOG_FSYNC_INTERVAL_SECONDS):
+        self.path = path
+        self.session_id = os.path.splitext(os.path.basename(path))[0]
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _truncate_torn_tail(path)
+        self.file = open(path, "a", encoding="utf-8")
+        self.pending = 0
+        self.last_fsync = time.monotonic()
+
+    @classmethod
+    def create(cls, user_prompt, working_directory, model_name, log_dir=SESSION_LOG_DIR, context=None,
+               tiers=None):
+        """
+        Starts a new session log and writes its header record. `context` is the
+        packed repository context sent with the first prompt, kept so a resumed
+        session sees exactly the same first message. `tiers` are the router's
+        model tiers, if the session is routed, so a resume uses the same models.
+        """
+        session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        log = cls(session_log_path(session_id, log_dir))
+        log.append({
+            "type": "session",
+            "prompt": user_prompt,
+            "working_directory": os.path.abspath(working_directory),
+            "model": model_name,
+            "context": context,
+            "tiers": tiers,
+            "created": time.time(),
+        })
+        return log
+
+    def append(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.pending += 1
+        if (self.pending >= self.fsync_every
+                or time.monotonic() - self.last_fsync >= self.fsync_interval):
+            self.sync()
+
+    def append_turn(self, turn, messages, workspace_changes, usage_metadata):
+        usage = None
+        if usage_metadata is not None:
+            usage = {
+                "prompt_tokens": usage_metadata.prompt_token_count,
+                "response_tokens": usage_metadata.candidates_token_count,
+                "cached_tokens": usage_metadata.cached_content_token_count,
+            }
+        self.append({
+            "type": "turn",
+            "turn": turn,
+            "messages": [m.model_dump(mode="json", exclude_none=True) for m in messages],
+            "workspace_changes": workspace_changes,
+            "usage": usage,
+        })
+
+    def finish(self, stop_reason, final_response):
+        self.append({"type": "end", "stop_reason": stop_reason, "final_response": final_response})
+
+    def sync(self):
+        if self.pending:
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_fsync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def session_log_path(session_id, log_dir=SESSION_LOG_DIR):
+    """Returns the log path for `session_id`; also accepts a path to a log file."""
+    if session_id.endswith(".jsonl") and os.path.isfile(session_id):
+        return session_id
+    return os.path.join(log_dir, f"{session_id}.jsonl")
+
+
+def _truncate_torn_tail(path, block_size=65536):
+    """
+    Cuts `path` back to its last complete line, so records appended after a
+    crash mid-write do not end up glued to the torn fragment.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - block_size, 0)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                keep = start + newline + 1
+                break
+            position = start
+        else:
+            keep = 0
+        if keep < end:
+            f.truncate(keep)
+
+
+def load_session(session_id, log_dir=SESSION_LOG_DIR):
+    """
+    Rebuilds a session from its log.
+
+    Returns:
+        dict: "path", "prompt", "working_directory", "model", "tiers"
+              (the router's model tiers, or None), "messages"
+              (list[types.Content], ready to continue the conversation),
+              "turns" (completed turns), "workspace_changes" (list of the
+              per-turn {path: content} dicts, oldest first) and "end" (the end
+              record, or None if the session never finished).
+
+    Raises:
+        FileNotFoundError: If there is no log for the session.
+        ValueError: If the log has no session header.
+    """
+    path = session_log_path(session_id, log_dir)
+    header = None
+    state = {"messages": [], "turns": 0, "workspace_changes": [], "end": None}
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn line from a crash mid-write; the records around it are intact
+                continue
+            if record["type"] == "session":
+                header = record
+            elif record["type"] == "turn":
+                state["messages"].extend(types.Content.model_validate(m) for m in record["messages"])
+                state["turns"] = record["turn"]
+                state["workspace_changes"].append(record["workspace_changes"])
+                state["end"] = None
+            elif record["type"] == "end":
+                state["end"] = record
+
+    if header is None:
+        raise ValueError(f'Session log "{path}" has no session header')
+
+    initial_parts = [types.Part(text=header["prompt"])]
+    if header.get("context"):
+        initial_parts.append(types.Part(text=header["context"]))
+    initial_prompt = types.Content(role="user", parts=initial_parts)
+    state["messages"].insert(0, initial_prompt)
+    state.update(
+        path=path,
+        prompt=header["prompt"],
+        working_directory=header["working_directory"],
+        model=header["model"],
+        tiers=header.get("tiers"),
+    )
+    return state
+
+
+def restore_workspace(state, working_directory=None):
+    """
+    Replays every logged write_file change, oldest first, so the workspace
+    matches the state the session had reached. Replaying is idempotent, so it
+    is safe when the files are already up to date.
+
+    Returns:
+        list[str]: Error messages from write_file, if any.
+    """
+    working_directory = working_directory or state["working_directory"]
+    errors = []
+    for changes in state["workspace_changes"]:
+        for file_path, content in changes.items():
+            result = write_file(working_directory, file_path, content)
+            if result.startswith("Error:"):
+                errors.append(result)
+    get_workspace(working_directory).flush()
+    return errors
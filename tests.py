@@ -1,7 +1,23 @@
 import os
 import sys
+import shutil
 import subprocess
-from functions.run_python import run_python_file
+import tempfile
+import time
+import asyncio
+from functions.run_python import run_python_file, run_limited
+from functions.get_file_content import get_file_content
+from functions.write_file import write_file
+from functions.output_compressor import compress_output, keep_raw_output, save_raw_output
+from google.genai import types
+from context_cache import ContextCache, LocalCacheService
+from best_of_n import run_best_of_n
+from server import AgentServer, send_request
+from agent import run_agent
+from session_log import SessionLog, load_session, restore_workspace
+from router import ModelRouter
+from context_packer import pack_workspace_context, rank_files, _load_analysis, _memory_cache
+from config import CONTEXT_PACK_CACHE_KEEP, CONTEXT_PACK_MEMORY_ENTRIES
 
 # # --- Setup for specific calculator/main.py behavior for tests ---
 # # This part ensures that 'calculator/main.py' behaves as expected for the tests.
@@ -100,6 +116,546 @@ def run_all_python_tests():
     print("-" * 30)
     
 
+# --- Resource limit tests (scripts in a temporary workspace) ---
+def run_resource_limit_tests():
+    print("Running resource limit tests...\n")
+    workspace = tempfile.mkdtemp(prefix="limits-")
+    marker = os.path.join(workspace, "grandchild-survived")
+    scripts = {
+        "sleep.py": "import time\ntime.sleep(10)\n",
+        "spin.py": "while True:\n    pass\n",
+        "allocate.py": "block = bytearray(400 * 1024 * 1024)\n",
+        # Exits at once, leaving a grandchild that would write the marker later
+        "spawn.py": (
+            "import subprocess, sys\n"
+            f"subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(1); open({marker!r}, \"w\").close()'])\n"
+        ),
+    }
+    for name, source in scripts.items():
+        with open(os.path.join(workspace, name), "w") as f:
+            f.write(source)
+
+    run = run_limited([sys.executable, "sleep.py"], workspace, {"timeout": 1})
+    print(f"Sleeping script timed out (expected True): {run['timed_out']}")
+    print(f"Killed at the timeout (expected True): {run['wall_time'] < 5}")
+
+    run = run_limited([sys.executable, "spin.py"], workspace, {"timeout": 10, "cpu_seconds": 1})
+    print(f"CPU cap stops a busy loop before the timeout (expected True): {run['returncode'] < 0 and not run['timed_out']}")
+    print(f"CPU time used (expected True): {run['usage'].ru_utime + run['usage'].ru_stime >= 0.5}")
+
+    run = run_limited([sys.executable, "allocate.py"], workspace, {"memory_bytes": 200 * 1024 * 1024})
+    print(f"Memory cap refuses a large allocation (expected True): {'MemoryError' in run['stderr']}")
+
+    run = run_limited([sys.executable, "spawn.py"], workspace)
+    time.sleep(1.5)
+    print(f"Grandchild killed with the process group (expected False): {os.path.exists(marker)}")
+
+    result = run_python_file(workspace, "spin.py", limits={"timeout": 10, "cpu_seconds": 1})
+    print(f"Kill reported (expected True): {'Process killed by' in result}")
+    print(f"Resources line reported (expected True): {result.splitlines()[-1].startswith('Resources: wall=')}")
+    shutil.rmtree(workspace)
+    print("-" * 30)
+
+
+# --- Context cache tests (local stand-in for the cache API) ---
+class StubModels:
+    """Stands in for client.models; reports half the prompt as cached when a cache is used."""
+    def __init__(self):
+        self.configs = []
+
+    def generate_content(self, model, contents, config):
+        self.configs.append(config)
+        cached = 800 if config.cached_content else 0
+        return types.GenerateContentResponse(
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=1600, cached_content_token_count=cached,
+            )
+        )
+
+
+class StubFailingModels(StubModels):
+    """Stands in for client.models; the first call raises `error`."""
+    def __init__(self, error):
+        super().__init__()
+        self.error = error
+
+    def generate_content(self, model, contents, config):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return super().generate_content(model, contents, config)
+
+
+def run_context_cache_tests():
+    print("Running context cache tests...\n")
+    now = [1000.0]
+    clock = lambda: now[0]
+
+    # Test 1: The prefix is uploaded once and reused on later turns
+    service = LocalCacheService(clock=clock)
+    models = StubModels()
+    cache = ContextCache(service, "system prompt", [], ttl_seconds=600, clock=clock, min_tokens=0)
+    for _ in range(3):
+        cache.generate_content(models, "stub-model", [], max_output_tokens=2048)
+    print(f"Cache creations after 3 turns (expected 1): {service.create_calls}")
+    print(f"Cached/uncached tokens (expected 2400/2400): {cache.cached_tokens}/{cache.uncached_tokens}")
+    print("-" * 30)
+
+    # Test 2: The entry is recreated once its TTL runs out
+    now[0] += 600
+    cache.generate_content(models, "stub-model", [])
+    print(f"Cache creations after TTL expiry (expected 2): {service.create_calls}")
+    print("-" * 30)
+
+    # Test 3: Falls back to the inline prefix when caching is unavailable
+    models = StubModels()
+    cache = ContextCache(LocalCacheService(clock=clock, fail=True), "system prompt", [], clock=clock, min_tokens=0)
+    cache.generate_content(models, "stub-model", [])
+    last_config = models.configs[-1]
+    print(f"Fallback sent prefix inline (expected True): {last_config.cached_content is None and last_config.system_instruction == 'system prompt'}")
+    print(f"Caching disabled for model (expected True): {'stub-model' in cache.disabled}")
+    print("-" * 30)
+
+    # Test 4: A prefix below the minimum cacheable size is never uploaded
+    service = LocalCacheService(clock=clock)
+    cache = ContextCache(service, "system prompt", [], clock=clock)
+    cache.generate_content(StubModels(), "stub-model", [])
+    print(f"Cache creations for a tiny prefix (expected 0): {service.create_calls}")
+    print(f"Calls below the minimum (expected 1): {cache.below_minimum}")
+    print("-" * 30)
+
+    # Test 4b: With the real minimum, a packed first message makes the session prefix cacheable
+    service = LocalCacheService(clock=clock)
+    models = StubModels()
+    cache = ContextCache(service, "system prompt", [], clock=clock)
+    first = types.Content(role="user", parts=[
+        types.Part(text="3 + 5 gives -2"), types.Part(text="x = 1\n" * 3000),  # about a full context pack
+    ])
+    reply = types.Content(role="model", parts=[types.Part(text="Looking.")])
+    contents = [first]
+    cache.generate_content(models, "stub-model", contents)
+    for _ in range(2):
+        contents = contents + [reply]
+        cache.generate_content(models, "stub-model", contents)
+    cached_config = service.get_config(models.configs[-1].cached_content)
+    print(f"Cache creations for a packed session (expected 1): {service.create_calls}")
+    print(f"First message stored in the cache (expected True): {cached_config.contents[0] == first}")
+    print("-" * 30)
+
+    # Test 5: A missing entry is recreated; a rate-limit error is raised without touching the cache
+    service = LocalCacheService(clock=clock)
+    cache = ContextCache(service, "system prompt", [], clock=clock, min_tokens=0)
+    cache.generate_content(StubFailingModels(KeyError("Cached content not found: gone")), "stub-model", [])
+    print(f"Cache creations after an evicted entry (expected 2): {service.create_calls}")
+    try:
+        cache.generate_content(StubFailingModels(RuntimeError("429 RESOURCE_EXHAUSTED")), "stub-model", [])
+        print("Rate-limit error raised (expected True): False")
+    except RuntimeError:
+        print("Rate-limit error raised (expected True): True")
+    print(f"Cache creations after a rate-limit error (expected 2): {service.create_calls}")
+    print(f"Caching still enabled (expected True): {'stub-model' not in cache.disabled}")
+    print("-" * 30)
+
+
+# --- Best-of-N tests (stub model, scratch copy of the calculator) ---
+class StubFixModels:
+    """
+    Stands in for client.models. The first turn of every session rewrites
+    pkg/calculator.py: high-temperature candidates restore the correct "+",
+    the others write a wrong fix. The second turn ends the session.
+    """
+    def __init__(self, good_source, bad_source):
+        self.good_source = good_source
+        self.bad_source = bad_source
+
+    def generate_content(self, model, contents, config):
+        if len(contents) > 1:
+            part = types.Part(text="Fixed the addition operator.")
+        else:
+            source = self.good_source if config.temperature >= 0.5 else self.bad_source
+            part = types.Part(function_call=types.FunctionCall(
+                name="write_file", args={"file_path": "pkg/calculator.py", "content": source},
+            ))
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+        )
+
+
+class StubClient:
+    def __init__(self, models):
+        self.models = models
+
+
+def run_best_of_n_tests():
+    print("Running best-of-N tests...\n")
+    workspace = tempfile.mkdtemp(prefix="best-of-n-")
+    shutil.copytree("calculator", workspace, dirs_exist_ok=True)
+    calculator_path = os.path.join(workspace, "pkg", "calculator.py")
+    with open(calculator_path) as f:
+        good_source = f.read()
+    bad_source = good_source.replace('"+": lambda a, b: a + b', '"+": lambda a, b: a - b')
+    with open(calculator_path, "w") as f:
+        f.write(bad_source)
+
+    client = StubClient(StubFixModels(good_source, bad_source))
+    cache = ContextCache(None, "system prompt", [])
+    outcome = run_best_of_n(client, cache, "3 + 5 gives -2", 3, working_directory=workspace)
+
+    for candidate in outcome["candidates"]:
+        print(f"Candidate {candidate['index']}: passed={candidate['score']['passed']} changed={candidate['diff']['changed']}")
+    print(f"Winner is a passing candidate (expected 1 or 2): {outcome['winner']['index'] if outcome['winner'] else None}")
+    with open(calculator_path) as f:
+        print(f"Fix applied to workspace (expected True): {f.read() == good_source}")
+    leftover = [name for name in os.listdir(os.path.dirname(workspace)) if name.startswith(f".{os.path.basename(workspace)}-snapshot-")]
+    print(f"Snapshots cleaned up (expected True): {not leftover}")
+    shutil.rmtree(workspace)
+    print("-" * 30)
+
+
+# --- Agent server tests (stub model with a fixed latency) ---
+class StubSlowModels:
+    """Stands in for client.models; answers with text after a fixed delay."""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.latency)
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(
+                role="model", parts=[types.Part(text="Nothing to fix.")]
+            ))]
+        )
+
+
+def run_server_tests():
+    print("Running agent server tests...\n")
+    root = tempfile.mkdtemp(prefix="agent-server-")
+    os.makedirs(os.path.join(root, "one", "nested"))
+    os.makedirs(os.path.join(root, "two"))
+    socket_path = os.path.join(root, "agent.sock")
+
+    async def scenario():
+        server = AgentServer(StubClient(StubSlowModels(0.3)), workspace_root=root, max_concurrent_sessions=1)
+        await server.start(socket_path=socket_path)
+        try:
+            sessions = [
+                asyncio.create_task(send_request({"op": "run", "prompt": "hi", "workspace": name}, socket_path))
+                for name in ("one", "two")
+            ]
+            await asyncio.sleep(0.1)
+            busy = await send_request({"op": "metrics"}, socket_path)
+            overlapping = await send_request({"op": "run", "prompt": "hi", "workspace": "one/nested"}, socket_path)
+            results = await asyncio.gather(*sessions)
+            outside = await send_request({"op": "run", "prompt": "hi", "workspace": "../"}, socket_path)
+            missing = await send_request({"op": "run", "prompt": "hi"}, socket_path)
+            whole_root = await send_request({"op": "run", "prompt": "hi", "workspace": "."}, socket_path)
+            done = await send_request({"op": "metrics"}, socket_path)
+        finally:
+            await server.close()
+        return busy, results, overlapping, outside, missing, whole_root, done
+
+    busy, results, overlapping, outside, missing, whole_root, done = asyncio.run(scenario())
+    print(f"While busy in_flight/queue_depth (expected 1/1): {busy['in_flight']}/{busy['queue_depth']}")
+    print(f"Session responses (expected 2x 'Nothing to fix.'): {[r.get('final_response') for r in results]}")
+    print(f"Workspace outside root rejected (expected True): {'error' in outside}")
+    print(f"Workspace nested in a busy one rejected (expected True): {'error' in overlapping}")
+    print(f"Request without a workspace rejected (expected True): {'error' in missing}")
+    print(f"Workspace root itself rejected (expected True): {'error' in whole_root}")
+    print(f"Completed sessions (expected 2): {done['completed']}")
+    shutil.rmtree(root)
+    print("-" * 30)
+
+
+# --- Loop detection tests (stub model stuck on one call) ---
+class StubLoopingModels:
+    """Stands in for client.models; lists the working directory on every turn."""
+    def __init__(self):
+        self.hints_seen = 0
+
+    def generate_content(self, model, contents, config):
+        self.hints_seen = sum(1 for c in contents if c.role == "user") - 1
+        part = types.Part(function_call=types.FunctionCall(name="get_files_info", args={"directory": "."}))
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))]
+        )
+
+
+def run_loop_guard_tests():
+    print("Running loop detection tests...\n")
+    models = StubLoopingModels()
+    session = run_agent(StubClient(models), ContextCache(None, "system prompt", []),
+                        "list files", working_directory="calculator", max_iterations=10)
+    print(f"Corrective hints sent (expected 1): {models.hints_seen}")
+    print(f"Turns taken (expected 4): {session['turns']}")
+    print(f"Repeated calls answered from cache (expected 3): {session['repeats_served']}")
+    print(f"Turns saved (expected 6): {session['turns_saved']}")
+    print("-" * 30)
+
+
+# --- Session checkpoint/resume tests (stub model, scratch workspace) ---
+def run_session_log_tests():
+    print("Running session checkpoint/resume tests...\n")
+    workspace = tempfile.mkdtemp(prefix="session-log-")
+    log_dir = os.path.join(workspace, ".sessions")
+    shutil.copytree("calculator", workspace, dirs_exist_ok=True)
+    calculator_path = os.path.join(workspace, "pkg", "calculator.py")
+    with open(calculator_path) as f:
+        good_source = f.read()
+    bad_source = good_source.replace('"+": lambda a, b: a + b', '"+": lambda a, b: a - b')
+    with open(calculator_path, "w") as f:
+        f.write(bad_source)
+
+    client = StubClient(StubFixModels(good_source, bad_source))
+    cache = ContextCache(None, "system prompt", [])
+
+    # Run one turn (the fix) and hit the iteration cap
+    log = SessionLog.create("3 + 5 gives -2", workspace, "stub-model", log_dir=log_dir)
+    run_agent(client, cache, "3 + 5 gives -2", working_directory=workspace,
+              max_iterations=1, generation_config={"temperature": 1.0}, session_log=log)
+    log.close()
+
+    # Lose the fix on disk, then rebuild everything from the log
+    with open(calculator_path, "w") as f:
+        f.write(bad_source)
+    state = load_session(log.session_id, log_dir=log_dir)
+    print(f"Completed turns in log (expected 1): {state['turns']}")
+    print(f"Messages rebuilt (expected 3): {len(state['messages'])}")
+    print(f"Stop reason (expected max_iterations): {state['end']['stop_reason']}")
+    restore_workspace(state)
+    with open(calculator_path) as f:
+        print(f"Workspace restored from log (expected True): {f.read() == good_source}")
+
+    log = SessionLog(state["path"])
+    session = run_agent(client, cache, state["prompt"], working_directory=workspace,
+                        messages=state["messages"], start_turn=state["turns"], session_log=log)
+    log.close()
+    print(f"Model turns needed after resume (expected 1): {session['turns']}")
+    print(f"Logged turns after resume (expected 2): {load_session(log.session_id, log_dir=log_dir)['turns']}")
+
+    # A crash mid-write leaves a torn last line; turns logged after resuming must survive it
+    with open(state["path"], "a") as f:
+        f.write('{"type": "turn", "tur')
+    state = load_session(log.session_id, log_dir=log_dir)
+    log = SessionLog(state["path"])
+    log.append_turn(state["turns"] + 1, [], {}, None)
+    log.close()
+    print(f"Turns after resuming past a torn line (expected 3): {load_session(log.session_id, log_dir=log_dir)['turns']}")
+    shutil.rmtree(workspace)
+    print("-" * 30)
+
+
+# --- Workspace (VFS) tests ---
+def run_workspace_tests():
+    print("Running workspace tests...\n")
+    root = tempfile.mkdtemp(prefix="workspace-")
+    workspace = os.path.join(root, "calculator")
+    sibling = os.path.join(root, "calculator2")
+    os.makedirs(workspace)
+    os.makedirs(sibling)
+    with open(os.path.join(sibling, "secret.txt"), "w") as f:
+        f.write("secret")
+
+    # Test 1: A sibling directory sharing the name prefix is outside the workspace
+    print(f"Sibling read: {get_file_content(workspace, '../calculator2/secret.txt')}")
+
+    # Test 2: A pending write is visible to reads before it reaches disk
+    write_file(workspace, "hello.py", "print('hello from the overlay')")
+    print(f"Read before flush: {get_file_content(workspace, 'hello.py')}")
+    print(f"On disk before run (expected False): {os.path.exists(os.path.join(workspace, 'hello.py'))}")
+
+    # Test 3: run_python_file flushes pending writes first
+    print(run_python_file(workspace, "hello.py").splitlines()[1])
+    print(f"On disk after run (expected True): {os.path.exists(os.path.join(workspace, 'hello.py'))}")
+    shutil.rmtree(root)
+    print("-" * 30)
+
+
+# --- Output compression tests ---
+def run_output_compression_tests():
+    print("Running output compression tests...\n")
+    workspace = os.path.abspath("calculator")
+    raw = "\n".join(
+        ["polling..."] * 50 + [
+            "Traceback (most recent call last):",
+            f'  File "{workspace}/main.py", line 20, in main',
+            "    result = calculator.evaluate(expression)",
+            '  File "/usr/lib/python3.12/json/decoder.py", line 337, in decode',
+            "    obj, end = self.raw_decode(s, idx=_w(s, 0).end())",
+            '  File "/usr/lib/python3.12/json/decoder.py", line 355, in raw_decode',
+            "    raise JSONDecodeError(\"Expecting value\", s, err.value) from None",
+            "ValueError: invalid token: $",
+        ]
+    )
+    compressed = compress_output(raw, workspace)
+    print(compressed)
+    print(f"Compression ratio: {len(raw) / len(compressed):.1f}x")
+
+    # Raw output is only kept once enabled (main.py does so for --verbose), and rotated
+    log_dir = tempfile.mkdtemp(prefix="runs-")
+    result = run_python_file("calculator", "tests.py")
+    print(f"Tool result names no raw output path (expected False): {'.log' in result}")
+    print(f"Nothing saved while disabled (expected True): {save_raw_output('tests.py', 'out', 'err') is None}")
+    keep_raw_output(log_dir)
+    try:
+        for _ in range(55):
+            save_raw_output("tests.py", "out", "err")
+    finally:
+        keep_raw_output(None)
+    print(f"Raw output logs kept (expected 50): {len(os.listdir(log_dir))}")
+    shutil.rmtree(log_dir)
+    print("-" * 30)
+
+
+# --- Model routing tests (stub tiers with different latency profiles) ---
+class StubTieredModels:
+    """
+    Stands in for client.models with a fast and a strong model. Scripted
+    session: read the buggy file, write the fix, run the tests, report.
+    With fail_fast=True the fast model returns an empty response.
+    """
+    def __init__(self, good_source, latencies, fail_fast=False):
+        self.good_source = good_source
+        self.latencies = latencies
+        self.fail_fast = fail_fast
+        self.calls = []
+
+    def generate_content(self, model, contents, config):
+        time.sleep(self.latencies[model])
+        self.calls.append((model, config.max_output_tokens))
+        if self.fail_fast and model == "fast-model":
+            return types.GenerateContentResponse(candidates=[])
+
+        step = len(contents) // 2
+        if step == 0:
+            part = types.Part(function_call=types.FunctionCall(name="get_file_content", args={"file_path": "pkg/calculator.py"}))
+        elif step == 1:
+            part = types.Part(function_call=types.FunctionCall(
+                name="write_file", args={"file_path": "pkg/calculator.py", "content": self.good_source},
+            ))
+        elif step == 2:
+            part = types.Part(function_call=types.FunctionCall(name="run_python_file", args={"file_path": "tests.py"}))
+        else:
+            part = types.Part(text="Fixed the addition operator; all tests pass.")
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=100, candidates_token_count=10),
+        )
+
+
+def run_router_tests():
+    print("Running model routing tests...\n")
+    tiers = {
+        "fast": {"model": "fast-model", "max_output_tokens": 1024},
+        "strong": {"model": "strong-model", "max_output_tokens": 8192},
+    }
+    latencies = {"fast-model": 0.01, "strong-model": 0.05}
+    workspace = tempfile.mkdtemp(prefix="router-")
+    shutil.copytree("calculator", workspace, dirs_exist_ok=True)
+    with open(os.path.join(workspace, "pkg", "calculator.py")) as f:
+        good_source = f.read()
+
+    # Test 1: Exploration and verification on the fast tier, the edit on the strong tier
+    models = StubTieredModels(good_source, latencies)
+    router = ModelRouter(tiers=tiers)
+    run_agent(StubClient(models), ContextCache(None, "system prompt", []), "fix it",
+              working_directory=workspace, router=router)
+    print(f"Tiers per turn (expected fast, strong, fast, fast): {', '.join(router.turn_tiers)}")
+    print(f"Edit turn output budget (expected 8192): {models.calls[1][1]}")
+    fast, strong = router.stats["fast"], router.stats["strong"]
+    print(f"Mean latency fast < strong (expected True): {fast['latency'] / fast['turns'] < strong['latency'] / strong['turns']}")
+    print(f"Tokens recorded per tier (expected 300/100 prompt): {fast['prompt_tokens']}/{strong['prompt_tokens']}")
+
+    # Test 2: An empty response from the fast tier is retried on the strong tier
+    models = StubTieredModels(good_source, latencies, fail_fast=True)
+    router = ModelRouter(tiers=tiers)
+    run_agent(StubClient(models), ContextCache(None, "system prompt", []), "fix it",
+              working_directory=workspace, router=router, max_iterations=1)
+    print(f"Models called on a failed cheap turn (expected fast-model, strong-model): {', '.join(m for m, _ in models.calls)}")
+    print(f"Fast tier escalations (expected 1): {router.stats['fast']['escalations']}")
+
+    # Test 3: A router rebuilt for a resumed session continues in the logged phase
+    logged = [
+        types.Content(role="user", parts=[types.Part(text="fix it")]),
+        types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(
+            name="get_file_content", args={"file_path": "pkg/calculator.py"}))]),
+        types.Content(role="tool", parts=[types.Part.from_function_response(
+            name="get_file_content", response={"result": good_source})]),
+    ]
+    router = ModelRouter(tiers=tiers)
+    router.replay(logged)
+    print(f"Resumed phase/tier (expected edit/strong): {router.phase()}/{router.choose_tier()}")
+    shutil.rmtree(workspace)
+    print("-" * 30)
+
+
+
+# --- Context packer tests (copy of the calculator workspace) ---
+def run_context_packer_tests():
+    print("Running context packer tests...\n")
+    workspace = tempfile.mkdtemp(prefix="pack-")
+    shutil.copytree("calculator", workspace, dirs_exist_ok=True, ignore=shutil.ignore_patterns("__pycache__"))
+    cache_dir = tempfile.mkdtemp(prefix="pack-cache-")
+    prompt = "3 + 5 gives the wrong result in the calculator's addition"
+
+    pack = pack_workspace_context(workspace, prompt, token_budget=1000, cache_dir=cache_dir)
+    print(f"Analyses cached on disk (expected 1): {len(os.listdir(cache_dir))}")
+    print(f"Pack within budget (expected True): {len(pack) <= 1000 * 4}")
+    print(f"Calculator source in full (expected True): {'--- pkg/calculator.py (full) ---' in pack}")
+    print(f"Tree lists lorem.txt (expected True): {'- lorem.txt' in pack}")
+
+    contents = {}
+    for root, _, names in os.walk(workspace):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                contents[os.path.relpath(path, workspace)] = f.read()
+    ranking = rank_files(_load_analysis(contents, None), prompt)
+    print(f"Top ranked file (expected pkg/calculator.py): {ranking[0][0]}")
+
+    small = pack_workspace_context(workspace, prompt, token_budget=300, cache_dir=cache_dir)
+    print(f"Small budget falls back to outlines (expected True): {'(outline)' in small and len(small) <= 300 * 4}")
+    print(f"Unchanged workspace reuses the cached analysis (expected 1): {len(os.listdir(cache_dir))}")
+
+    # The agent's first message carries the pack
+    models = StubModels()
+    session = run_agent(StubClient(models), ContextCache(None, "system prompt", []), prompt,
+                        working_directory=workspace, max_iterations=1, context_pack=pack)
+    print(f"First message parts (expected 2): {len(session['messages'][0].parts)}")
+
+    # A large tree is summarised within the budget; VCS and dot-directories are not walked
+    os.makedirs(os.path.join(workspace, "data"))
+    for i in range(800):
+        with open(os.path.join(workspace, "data", f"sample_{i:03}.csv"), "w") as f:
+            f.write(f"{i},{i * i}\n")
+    os.makedirs(os.path.join(workspace, ".git", "objects"))
+    with open(os.path.join(workspace, ".git", "objects", "calculator.py"), "w") as f:
+        f.write("x = 1\n")
+    large = pack_workspace_context(workspace, prompt, token_budget=1000, cache_dir=cache_dir)
+    print(f"Large tree pack within budget (expected True): {len(large) <= 1000 * 4}")
+    print(f"Unlisted files summarised (expected True): {'more files not listed' in large}")
+    print(f"Calculator source still packed (expected True): {'--- pkg/calculator.py' in large}")
+    print(f"Dot-directories skipped (expected False): {'.git' in large}")
+
+    # Every workspace state adds an analysis; only the most recent ones are kept
+    for i in range(CONTEXT_PACK_CACHE_KEEP + 5):
+        _load_analysis({"main.py": f"print({i})\n".encode()}, cache_dir)
+    print(f"Analyses kept on disk (expected {CONTEXT_PACK_CACHE_KEEP}): {len(os.listdir(cache_dir))}")
+    print(f"Analyses kept in memory (expected {CONTEXT_PACK_MEMORY_ENTRIES}): {len(_memory_cache)}")
+    shutil.rmtree(workspace)
+    shutil.rmtree(cache_dir)
+    print("-" * 30)
+
+
 if __name__ == "__main__":
     run_all_python_tests()
+    run_resource_limit_tests()
+    run_context_cache_tests()
+    run_best_of_n_tests()
+    run_server_tests()
+    run_loop_guard_tests()
+    run_session_log_tests()
+    run_workspace_tests()
+    run_output_compression_tests()
+    run_router_tests()
+    run_context_packer_tests()
 